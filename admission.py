@@ -0,0 +1,187 @@
+import asyncio
+import os
+import re
+from collections import deque
+from typing import Deque, List, Optional
+
+import orjson
+
+from common import SAFE_METHODS
+from metrics import ADMISSION_QUEUED, ADMISSION_REJECTED, pool_pressure
+
+# Never queued or shed: monitoring, readiness and docs must answer under load.
+# /changes streams stay open indefinitely and are capped separately
+EXEMPT_PATHS = {"/metrics", "/ready", "/docs", "/redoc", "/openapi.json", "/changes"}
+
+# Routes that may run bcrypt
+HASHING_ROUTES = [
+    ("POST", re.compile(r"^/users/?$")),
+    ("PUT", re.compile(r"^/users/[^/]+/?$")),
+]
+
+
+class AdmissionClass:
+    """A concurrency limit with a bounded, time-limited FIFO wait queue.
+
+    Freed slots are handed straight to the oldest waiter, so a waiter that
+    times out at the same moment can never leak one.
+    """
+
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def saturated(self) -> bool:
+        return self.queued >= self.max_queue
+
+    async def acquire(self, timeout: float) -> Optional[str]:
+        """Take a slot, or return why the request should be shed"""
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return None
+        if self.saturated():
+            return "queue_full"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        ADMISSION_QUEUED.labels(self.name).inc()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # The slot arrived just as the wait expired
+                return None
+            waiter.cancel()
+            return "queue_timeout"
+        except BaseException:
+            # Cancelled while waiting, e.g. the client went away
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            waiter.cancel()
+            raise
+        finally:
+            ADMISSION_QUEUED.labels(self.name).dec()
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+        return None
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes to the waiter, active stays the same
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class AdmissionController:
+    """Per-class concurrency limits plus shedding on DB pool pressure.
+
+    Requests are sorted into ``read``, ``write`` and ``hashing`` classes so
+    slow password hashing or a write burst can't take every slot from cheap
+    reads. A request waits at most ``queue_timeout`` seconds for a slot; it
+    is rejected straight away when its class's queue is full, or when pool
+    checkouts have recently been waiting longer than ``max_pool_wait``.
+    Limits are per worker process.
+    """
+
+    def __init__(self, classes: List[AdmissionClass], queue_timeout: float, max_pool_wait: float):
+        self.classes = {admission_class.name: admission_class for admission_class in classes}
+        self.queue_timeout = queue_timeout
+        self.max_pool_wait = max_pool_wait
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        queue = int(os.getenv("ADMISSION_MAX_QUEUE", 100))
+        return cls(
+            [
+                AdmissionClass("read", int(os.getenv("ADMISSION_READ_LIMIT", 64)), queue),
+                AdmissionClass("write", int(os.getenv("ADMISSION_WRITE_LIMIT", 16)), queue),
+                AdmissionClass("hashing", int(os.getenv("ADMISSION_HASHING_LIMIT", 8)), queue),
+            ],
+            queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 1.0)),
+            max_pool_wait=float(os.getenv("ADMISSION_MAX_POOL_WAIT_MS", 250)) / 1000,
+        )
+
+    def classify(self, method: str, path: str) -> Optional[AdmissionClass]:
+        if path in EXEMPT_PATHS:
+            return None
+        if any(method == route_method and pattern.match(path) for route_method, pattern in HASHING_ROUTES):
+            return self.classes["hashing"]
+        return self.classes["read" if method in SAFE_METHODS else "write"]
+
+    def pool_saturated(self) -> bool:
+        return pool_pressure.wait() > self.max_pool_wait
+
+    def saturation(self) -> List[str]:
+        """Reasons this worker is saturated, empty when it can take traffic"""
+        reasons = [
+            f"{admission_class.name} queue full"
+            for admission_class in self.classes.values()
+            if admission_class.saturated()
+        ]
+        if self.pool_saturated():
+            reasons.append(f"pool checkout wait {pool_pressure.wait() * 1000:.0f} ms")
+        return reasons
+
+    def stats(self) -> dict:
+        return {
+            name: {"limit": c.limit, "active": c.active, "queued": c.queued, "max_queue": c.max_queue}
+            for name, c in self.classes.items()
+        }
+
+
+async def _reject(send, reason: str):
+    body = orjson.dumps({"detail": f"Server overloaded ({reason}), retry shortly"})
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", b"1"),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController, 503 + Retry-After when shedding"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        admission_class = self.controller.classify(scope["method"], scope["path"])
+        if admission_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Don't start work the pool can't serve in time
+        reason = "pool_pressure" if self.controller.pool_saturated() else None
+        if reason is None:
+            reason = await admission_class.acquire(self.controller.queue_timeout)
+        if reason is not None:
+            ADMISSION_REJECTED.labels(admission_class.name, reason).inc()
+            await _reject(send, reason)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_class.release()
+
+
+admission = AdmissionController.from_env()
@@ -0,0 +1,347 @@
+"""HTTP load benchmark for every route, with a regression check.
+
+Seed the database (``python -m benchmarks.seed --reset``), start the
+server, then drive each route at fixed concurrency levels:
+
+    python -m benchmarks.load run --url http://127.0.0.1:8000 \\
+        --concurrency 1,16,64 --duration 10 --out results.json
+
+Each route runs on its own, so its numbers aren't mixed with others'.
+Requests are sent with ``X-Profile`` (pass the server's PROFILE_TOKEN
+with ``--profile-token``) and the ``Server-Timing`` header gives the number of SQL statements per request (BEGIN, COMMIT and
+ROLLBACK aren't counted). Write routes change the
+data: reseed with ``--reset`` before runs that will be compared.
+
+Compare two result files; exits with status 1 on a regression:
+
+    python -m benchmarks.load compare baseline.json results.json --tolerance 0.10
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+DB_TIMING = re.compile(r'\bdb;dur=[\d.]+;desc="(\d+) statements"')
+
+# kind, path prefix, creator field, date field, has rating
+CATALOGS = [
+    ("book", "/books", "author", "published_date", True),
+    ("movie", "/movies", "director", "release_date", True),
+    ("board_game", "/board_games", "designer", "release_date", False),
+    ("comic", "/comics", "author", "published_date", False),
+]
+
+
+@dataclass
+class Request:
+    method: str
+    url: str
+    json: Any = None
+
+
+@dataclass
+class Scenario:
+    name: str
+    make: Callable[["Context"], Awaitable[Request]]
+    # Full-table reads, only run with --heavy
+    heavy: bool = False
+
+
+class Context:
+    """What scenarios need to build requests: the client and id ranges"""
+
+    def __init__(self, client: httpx.AsyncClient, users: int, items_per_user: int, profile_token: str):
+        self.client = client
+        # The server only profiles requests carrying its PROFILE_TOKEN
+        self.profile_headers = {"X-Profile": profile_token} if profile_token else {}
+        self.users = users
+        self.items = users * items_per_user
+        self.rng = random.Random(7)
+        self.run_id = f"{int(time.time()):x}"
+        self._counter = itertools.count()
+
+    def user_id(self) -> int:
+        return self.rng.randint(1, self.users)
+
+    def item_id(self) -> int:
+        return self.rng.randint(1, self.items)
+
+    def unique(self, prefix: str) -> str:
+        return f"{prefix} {self.run_id}-{next(self._counter)}"
+
+
+def _get(path: Callable[["Context"], str]) -> Callable[["Context"], Awaitable[Request]]:
+    async def make(ctx: Context) -> Request:
+        return Request("GET", path(ctx))
+    return make
+
+
+def _item(kind: str, creator: str, date_field: str, rated: bool, ctx: Context) -> Dict[str, Any]:
+    body = {
+        "title": ctx.unique(f"bench {kind}")[:50],
+        creator: "Bench Author",
+        "genre": "Fiction",
+        date_field: "2024-01-01",
+        "user_id": ctx.user_id(),
+    }
+    if rated:
+        body["rating"] = 3
+    return body
+
+
+def _user(ctx: Context) -> Dict[str, Any]:
+    name = ctx.unique("bench").replace(" ", "_")
+    return {"name": name, "username": name, "email": f"{name}@example.com", "password": "benchmark"}
+
+
+def scenarios() -> List[Scenario]:
+    result = [
+        Scenario("GET /users", _get(lambda ctx: "/users?limit=50")),
+        Scenario("GET /users/{id}", _get(lambda ctx: f"/users/{ctx.user_id()}")),
+        Scenario("GET /users/{id}/collection", _get(lambda ctx: f"/users/{ctx.user_id()}/collection")),
+        Scenario("GET /users/collections", _get(
+            lambda ctx: "/users/collections?" + "&".join(f"ids={ctx.user_id()}" for _ in range(10)))),
+        Scenario("GET /search", _get(lambda ctx: f"/search?q={ctx.rng.choice(['river', 'silvr', 'empire'])}&limit=20")),
+        Scenario("GET /metrics", _get(lambda ctx: "/metrics")),
+        Scenario("GET /stats/totals", _get(lambda ctx: "/stats/totals")),
+        Scenario("GET /stats/users/{id}", _get(lambda ctx: f"/stats/users/{ctx.user_id()}")),
+    ]
+
+    async def add_user(ctx: Context) -> Request:
+        return Request("POST", "/users", _user(ctx))
+
+    async def update_user(ctx: Context) -> Request:
+        return Request("PUT", f"/users/{ctx.user_id()}", {"name": ctx.unique("renamed")[:50]})
+
+    async def delete_user(ctx: Context) -> Request:
+        # Untimed setup: a fresh user that owns nothing
+        created = await ctx.client.post("/users", json=_user(ctx))
+        return Request("DELETE", f"/users/{created.json()['id']}")
+
+    result += [
+        Scenario("POST /users", add_user),
+        Scenario("PUT /users/{id}", update_user),
+        Scenario("DELETE /users/{id}", delete_user),
+    ]
+
+    for kind, prefix, creator, date_field, rated in CATALOGS:
+        def catalog(kind=kind, prefix=prefix, creator=creator, date_field=date_field, rated=rated):
+            async def add(ctx: Context) -> Request:
+                return Request("POST", prefix, _item(kind, creator, date_field, rated, ctx))
+
+            async def bulk(ctx: Context) -> Request:
+                return Request("POST", f"{prefix}/bulk",
+                               [_item(kind, creator, date_field, rated, ctx) for _ in range(10)])
+
+            async def update(ctx: Context) -> Request:
+                return Request("PUT", f"{prefix}/{ctx.item_id()}", {"genre": ctx.rng.choice(["Fiction", "History"])})
+
+            async def delete(ctx: Context) -> Request:
+                created = await ctx.client.post(prefix, json=_item(kind, creator, date_field, rated, ctx))
+                return Request("DELETE", f"{prefix}/{created.json()['id']}")
+
+            return [
+                Scenario(f"GET {prefix}", _get(lambda ctx: f"{prefix}?limit=50")),
+                Scenario(f"GET {prefix} filtered", _get(lambda ctx: f"{prefix}?genre=Fiction&sort=-created_at&limit=50")),
+                Scenario(f"GET {prefix} with total", _get(lambda ctx: f"{prefix}?genre=Fiction&total=true&limit=50")),
+                Scenario(f"GET /stats{prefix}/genres", _get(lambda ctx: f"/stats{prefix}/genres")),
+                Scenario(f"GET /stats{prefix}/months", _get(lambda ctx: f"/stats{prefix}/months?since=2020-01-01")),
+                Scenario(f"GET {prefix}/{{id}}", _get(lambda ctx: f"{prefix}/{ctx.item_id()}")),
+                Scenario(f"GET {prefix}/export", _get(lambda ctx: f"{prefix}/export?format=ndjson"), heavy=True),
+                Scenario(f"POST {prefix}", add),
+                Scenario(f"POST {prefix}/bulk", bulk),
+                Scenario(f"PUT {prefix}/{{id}}", update),
+                Scenario(f"DELETE {prefix}/{{id}}", delete),
+            ]
+        result += catalog()
+    return result
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return math.nan
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+async def run_scenario(ctx: Context, scenario: Scenario, concurrency: int, duration: float) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statements: List[int] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            try:
+                request = await scenario.make(ctx)
+                started = time.perf_counter()
+                response = await ctx.client.request(
+                    request.method, request.url, json=request.json, headers=ctx.profile_headers)
+                elapsed = time.perf_counter() - started
+            except (httpx.HTTPError, KeyError, ValueError):
+                # Transport failures, or a setup request that didn't succeed
+                errors += 1
+                continue
+            if response.status_code >= 400:
+                errors += 1
+                continue
+            latencies.append(elapsed)
+            timing = DB_TIMING.search(response.headers.get("server-timing", ""))
+            if timing:
+                statements.append(int(timing.group(1)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "scenario": scenario.name,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / wall,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "db_statements": sum(statements) / len(statements) if statements else None,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args) -> Dict[str, Any]:
+    levels = [int(level) for level in args.concurrency.split(",")]
+    selected = [
+        scenario for scenario in scenarios()
+        if (args.heavy or not scenario.heavy)
+        and (args.only is None or re.search(args.only, scenario.name))
+    ]
+
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+        ctx = Context(client, args.users, args.items_per_user, args.profile_token)
+        results = []
+        for scenario in selected:
+            for concurrency in levels:
+                if args.warmup:
+                    await run_scenario(ctx, scenario, concurrency, args.warmup)
+                result = await run_scenario(ctx, scenario, concurrency, args.duration)
+                results.append(result)
+                print(
+                    f"{scenario.name:<34} c={concurrency:<4} {result['throughput_rps']:9.1f} req/s  "
+                    f"p50 {result['p50_ms']:7.1f}  p95 {result['p95_ms']:7.1f}  p99 {result['p99_ms']:7.1f} ms  "
+                    f"sql {'-' if result['db_statements'] is None else format(result['db_statements'], '.2f')}  "
+                    f"errors {result['errors']}"
+                )
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "url": args.url,
+            "duration": args.duration,
+            "concurrency": levels,
+            "users": args.users,
+            "items_per_user": args.items_per_user,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float) -> List[str]:
+    """Human readable regressions of ``current`` against ``baseline``"""
+    before = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = before.get((result["scenario"], result["concurrency"]))
+        if old is None or not old["requests"] or not result["requests"]:
+            continue
+        label = f"{result['scenario']} c={result['concurrency']}"
+        if result["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {old['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+        if result["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{label}: throughput {old['throughput_rps']:.1f} -> {result['throughput_rps']:.1f} req/s")
+        # Statement counts are deterministic, any increase is a real change.
+        # Baselines saved before the rename call the field db_round_trips
+        old_statements = old.get("db_statements", old.get("db_round_trips"))
+        if (old_statements is not None and result["db_statements"] is not None
+                and result["db_statements"] > old_statements + 0.01):
+            regressions.append(
+                f"{label}: SQL statements {old_statements:.2f} -> {result['db_statements']:.2f}")
+        if result["errors"] > old["errors"]:
+            regressions.append(f"{label}: errors {old['errors']} -> {result['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Drive the routes and record results")
+    run_parser.add_argument("--url", default="http://127.0.0.1:8000")
+    run_parser.add_argument("--concurrency", default="1,16,64", help="Comma separated levels")
+    run_parser.add_argument("--duration", type=float, default=10, help="Seconds per route and level")
+    run_parser.add_argument("--warmup", type=float, default=2, help="Untimed seconds before each run")
+    run_parser.add_argument("--timeout", type=float, default=30)
+    run_parser.add_argument("--users", type=int, default=1000, help="As passed to benchmarks.seed")
+    run_parser.add_argument("--items-per-user", type=int, default=20, help="As passed to benchmarks.seed")
+    run_parser.add_argument("--profile-token", default=os.getenv("PROFILE_TOKEN", ""),
+                            help="The server's PROFILE_TOKEN, needed for statement counts")
+    run_parser.add_argument("--only", default=None, help="Regex on scenario names, e.g. '^GET /books'")
+    run_parser.add_argument("--heavy", action="store_true", help="Include full-table exports")
+    run_parser.add_argument("--out", default="benchmark_results.json")
+    run_parser.add_argument("--baseline", default=None, help="Compare against this file when done")
+    run_parser.add_argument("--tolerance", type=float, default=0.10)
+
+    compare_parser = commands.add_parser("compare", help="Check results against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.10)
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        current = asyncio.run(run(args))
+        Path(args.out).write_text(json.dumps(current, indent=2))
+        print(f"\nResults written to {args.out}")
+        if args.baseline is None:
+            return
+        baseline = json.loads(Path(args.baseline).read_text())
+    else:
+        baseline = json.loads(Path(args.baseline).read_text())
+        current = json.loads(Path(args.current).read_text())
+
+    regressions = compare(baseline, current, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Seed PostgreSQL with a reproducible data set for the load benchmarks.
+
+Apply the migrations first (``alembic upgrade head``), then run from the
+repository root against the database in DATABASE_URL:
+
+    python -m benchmarks.seed --users 1000 --items-per-user 20 --reset
+
+Every user owns ``--items-per-user`` books, movies, board games and comics.
+The same ``--seed`` always produces the same rows, so results from
+different runs and branches are comparable.
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import Any, Dict, Iterator, List
+
+from dotenv import load_dotenv
+from sqlalchemy import insert, text
+
+from database import get_engine
+from hashing import pwd_context
+from models import BoardGame, Book, Comic, Movie, User
+
+GENRES = ["Fiction", "Science Fiction", "Fantasy", "Mystery", "History",
+          "Biography", "Horror", "Romance", "Strategy", "Family"]
+WORDS = ["shadow", "river", "empire", "garden", "winter", "machine", "silver",
+         "harbor", "signal", "forest", "echo", "crown", "desert", "orbit",
+         "lantern", "mirror", "storm", "atlas", "ember", "tide"]
+CREATORS = [f"{first} {last}" for first in ("Ada", "Ben", "Chen", "Dana", "Eli", "Fay", "Gus", "Hana")
+            for last in ("Moreau", "Okafor", "Lindqvist", "Tanaka", "Alvarez", "Novak")]
+
+# Rows per INSERT round trip
+BATCH_SIZE = 5000
+
+TABLES = ["comics", "board_games", "movies", "books", "users"]
+
+
+def _title(rng: random.Random, kind: str, number: int) -> str:
+    # Real words for full-text search, the number keeps titles unique
+    return f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {kind} {number}"
+
+
+def _date(rng: random.Random) -> str:
+    return f"{rng.randint(1950, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+
+
+def users(count: int, password_hash: str) -> Iterator[Dict[str, Any]]:
+    for number in range(1, count + 1):
+        yield {
+            "id": number,
+            "name": f"User {number}",
+            "username": f"user{number}",
+            "email": f"user{number}@example.com",
+            "password": password_hash,
+            "role": "admin" if number % 100 == 0 else "user",
+        }
+
+
+def items(model, rng: random.Random, user_count: int, per_user: int) -> Iterator[Dict[str, Any]]:
+    kind = model.__tablename__.rstrip("s").replace("_", " ")
+    for number in range(1, user_count * per_user + 1):
+        row = {
+            "id": number,
+            "title": _title(rng, kind, number),
+            "genre": rng.choice(GENRES),
+            "user_id": (number - 1) // per_user + 1,
+        }
+        if model is Book:
+            row.update(author=rng.choice(CREATORS), published_date=_date(rng), rating=rng.randint(1, 5))
+        elif model is Movie:
+            row.update(director=rng.choice(CREATORS), release_date=_date(rng), rating=rng.randint(1, 5))
+        elif model is BoardGame:
+            row.update(designer=rng.choice(CREATORS), release_date=_date(rng))
+        else:
+            row.update(author=rng.choice(CREATORS), published_date=_date(rng))
+        yield row
+
+
+def _batches(rows: Iterator[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def seed(user_count: int, per_user: int, reset: bool, seed_value: int):
+    rng = random.Random(seed_value)
+    # One real hash, shared: the benchmark logs in nobody, and hashing
+    # thousands of passwords would dominate the seeding time
+    password_hash = pwd_context().hash("benchmark")
+
+    async with get_engine().begin() as conn:
+        if reset:
+            await conn.execute(text(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE"))
+
+        sources = [
+            (User, users(user_count, password_hash)),
+            (Book, items(Book, rng, user_count, per_user)),
+            (Movie, items(Movie, rng, user_count, per_user)),
+            (BoardGame, items(BoardGame, rng, user_count, per_user)),
+            (Comic, items(Comic, rng, user_count, per_user)),
+        ]
+        for model, rows in sources:
+            started = time.perf_counter()
+            inserted = 0
+            for batch in _batches(rows):
+                await conn.execute(insert(model), batch)
+                inserted += len(batch)
+            # Explicit ids were inserted, move the sequence past them
+            await conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{model.__tablename__}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 1) FROM {model.__tablename__}))"
+            ))
+            print(f"  {model.__tablename__:<12} {inserted:>9} rows  {time.perf_counter() - started:6.1f} s")
+
+    # Fresh statistics so the planner sees the seeded distribution
+    async with get_engine().connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("ANALYZE"))
+    await get_engine().dispose()
+
+
+def main():
+    # A command line tool, so .env isn't loaded by a server first
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--items-per-user", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="Truncate all tables first")
+    args = parser.parse_args()
+
+    print(f"Seeding {args.users} users with {args.items_per_user} items of each kind")
+    asyncio.run(seed(args.users, args.items_per_user, args.reset, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Micro-benchmark: cost of serializing 1k rows, before and after response models.
+
+Before: the route returns ORM objects, FastAPI walks them with
+jsonable_encoder and JSONResponse renders with json.dumps.
+After: the route declares a Pydantic read model, pydantic-core validates
+and serializes it, and ORJSONResponse renders the result.
+
+Run from the repository root (no database needed):
+
+    python -m benchmarks.serialization --rows 1000 --repeat 50
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime
+from typing import List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from models import Book
+from schemas import BookRead
+
+
+def make_books(count: int) -> List[Book]:
+    now = datetime.now()
+    return [
+        Book(
+            id=i,
+            title=f"Title {i}",
+            author=f"Author {i % 97}",
+            genre="Fiction",
+            published_date="2023-01-01",
+            rating=i % 5,
+            user_id=i % 50,
+            created_at=now,
+            version=1,
+        )
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    books = make_books(args.rows)
+    adapter = TypeAdapter(List[BookRead])
+
+    def before():
+        return json.dumps(jsonable_encoder(books)).encode()
+
+    def after_orjson():
+        validated = adapter.validate_python(books, from_attributes=True)
+        return orjson.dumps(adapter.dump_python(validated, mode="json"))
+
+    def after_to_json():
+        validated = adapter.validate_python(books, from_attributes=True)
+        return adapter.dump_json(validated)
+
+    cases = [
+        ("jsonable_encoder + json.dumps (before)", before),
+        ("response_model + ORJSONResponse (after)", after_orjson),
+        ("response_model + pydantic-core to_json", after_to_json),
+    ]
+    baseline = None
+    print(f"{args.rows} rows, best of {args.repeat} runs")
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        per_1k = best * 1000 / args.rows * 1000
+        baseline = baseline or per_1k
+        print(f"  {name:<42} {per_1k:8.2f} ms / 1k rows  ({baseline / per_1k:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
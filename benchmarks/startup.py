@@ -0,0 +1,109 @@
+"""Cold-start report: where the time goes when a worker imports the app.
+
+Runs ``python -X importtime -c "import main"`` in fresh interpreters and
+breaks the best run down by top-level package and by this repository's
+own modules. Nothing connects to the database: the engine, passlib and
+bcrypt are set up in the lifespan, not at import.
+
+Run from the repository root:
+
+    python -m benchmarks.startup --runs 5 --threshold-ms 1500
+
+Exits with status 1 when importing the app takes longer than
+``--threshold-ms``, so CI can catch cold-start regressions.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def import_times(module: str) -> List[Tuple[str, int, int, int]]:
+    """(name, self us, cumulative us, depth) for every module imported"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        sys.exit(f"importing {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            rows.append((name, int(own), int(cumulative), len(indent) // 2))
+    return rows
+
+
+def first_party() -> set:
+    return {path.stem for path in ROOT.glob("*.py")}
+
+
+def report(rows: List[Tuple[str, int, int, int]], module: str, top: int) -> Dict:
+    total = next(cumulative for name, _, cumulative, _ in rows if name == module)
+
+    by_package: Dict[str, int] = defaultdict(int)
+    for name, own, _, _ in rows:
+        by_package[name.split(".")[0]] += own
+
+    ours = first_party()
+    own_modules = sorted(
+        ((name, own) for name, own, _, _ in rows if name in ours),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+    return {
+        "module": module,
+        "total_ms": total / 1000,
+        "packages_ms": {
+            name: own / 1000
+            for name, own in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+        },
+        "first_party_ms": {name: own / 1000 for name, own in own_modules[:top]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--threshold-ms", type=float, default=None)
+    parser.add_argument("--json", dest="json_path", default=None, help="Also write the report here")
+    args = parser.parse_args()
+
+    # The first run also warms the OS file cache; keep the fastest
+    runs = [report(import_times(args.module), args.module, args.top) for _ in range(args.runs)]
+    best = min(runs, key=lambda run: run["total_ms"])
+    best["runs_ms"] = [run["total_ms"] for run in runs]
+
+    print(f"import {args.module}: {best['total_ms']:.1f} ms (best of {args.runs})")
+    print("\n  by package (self time)")
+    for name, ms in best["packages_ms"].items():
+        print(f"    {name:<32} {ms:8.1f} ms")
+    print("\n  this repository's modules (self time)")
+    for name, ms in best["first_party_ms"].items():
+        print(f"    {name:<32} {ms:8.1f} ms")
+
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(best, indent=2))
+
+    if args.threshold_ms is not None and best["total_ms"] > args.threshold_ms:
+        print(f"\nFAIL: {best['total_ms']:.1f} ms exceeds the {args.threshold_ms:.0f} ms budget")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+from datetime import datetime
+from typing import Any, List
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+from sqlalchemy import literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import invalidate
+from constraints import constraint_errors
+from database import BatchLoader
+from models import User
+
+MAX_BULK_ITEMS = 1000
+
+
+def _error(index: int, detail: str) -> dict[str, Any]:
+    return {"index": index, "status": "error", "id": None, "detail": detail}
+
+
+async def bulk_upsert(
+    db: AsyncSession,
+    loader: BatchLoader,
+    model,
+    items: List[BaseModel],
+    on_conflict: str,
+    conflict_detail: str,
+    errors: dict[str, str],
+) -> List[dict[str, Any]]:
+    """Insert a batch of catalog items with a single INSERT ... ON CONFLICT.
+
+    All referenced users are checked through the request's BatchLoader in
+    one query, and every valid row is written by one multi-row statement
+    keyed on the unique ``title``.
+    ``on_conflict`` is ``"skip"`` (DO NOTHING) or ``"update"`` (DO UPDATE).
+    ``errors`` maps constraint names to 400 details, as for the single-item
+    routes; a user deleted after the check fails the whole batch with 400.
+    Returns one result per input item, in input order.
+    """
+    if len(items) > MAX_BULK_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BULK_ITEMS} items per request"
+        )
+
+    results: List[Any] = [None] * len(items)
+
+    # ON CONFLICT cannot touch the same row twice in one statement
+    pending = {}
+    for index, item in enumerate(items):
+        if item.title in pending:
+            results[index] = _error(index, "Duplicate title in batch")
+        else:
+            pending[item.title] = index
+
+    # Verify all referenced users exist in one batched round trip
+    user_ids = list({items[index].user_id for index in pending.values()})
+    users = await loader.load_many(User, user_ids)
+    existing_users = {user_id for user_id, user in zip(user_ids, users) if user is not None}
+
+    now = datetime.now()
+    rows = []
+    for title, index in list(pending.items()):
+        values = items[index].model_dump()
+        if values["user_id"] not in existing_users:
+            results[index] = _error(index, "Specified user does not exist")
+            del pending[title]
+            continue
+        rows.append({**values, "created_at": now})
+
+    if rows:
+        stmt = insert(model).values(rows)
+        if on_conflict == "update":
+            updatable = [key for key in rows[0] if key not in ("title", "created_at")]
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[model.title],
+                set_={
+                    **{key: stmt.excluded[key] for key in updatable},
+                    "version": model.version + 1,
+                }
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=[model.title])
+
+        # xmax is zero only for freshly inserted tuples
+        stmt = stmt.returning(
+            model.id, model.title, literal_column("xmax = 0").label("inserted")
+        )
+        async with constraint_errors(db, errors):
+            written = (await db.execute(stmt)).all()
+            await db.commit()
+        for row in written:
+            index = pending.pop(row.title)
+            results[index] = {
+                "index": index,
+                "status": "created" if row.inserted else "updated",
+                "id": row.id,
+                "detail": None,
+            }
+        await invalidate(model, *(
+            result["id"] for result in results
+            if result is not None and result["status"] == "updated"
+        ))
+
+    # Whatever DO NOTHING skipped already existed
+    for index in pending.values():
+        results[index] = {
+            "index": index,
+            "status": "skipped",
+            "id": None,
+            "detail": conflict_detail,
+        }
+
+    return results
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from common import json_default
+from filters import whitelist
+
+
+class NullBackend:
+    """Caches nothing; every read goes to the loader"""
+
+    async def get(self, key: str) -> Optional[dict]:
+        return None
+
+    async def set(self, key: str, value: dict):
+        pass
+
+    async def delete(self, key: str):
+        pass
+
+
+class MemoryBackend:
+    """In-process LRU cache with a per-entry TTL.
+
+    Each worker process has its own copy, so entries written through another
+    worker stay visible here for at most ``ttl`` seconds.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: dict):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+
+class RedisBackend:
+    """Shared cache in Redis, so all workers see the same entries.
+
+    Needs the optional ``redis`` package (``pip install redis``).
+    """
+
+    def __init__(self, url: str, ttl: float):
+        try:
+            from redis import asyncio as redis
+        except ImportError as exc:
+            raise RuntimeError(
+                "ENTITY_CACHE_BACKEND=redis requires the 'redis' package"
+            ) from exc
+        self._client = redis.from_url(url)
+        self.ttl = ttl
+
+    async def get(self, key: str) -> Optional[dict]:
+        raw = await self._client.get(key)
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key: str, value: dict):
+        payload = json.dumps(value, default=json_default)
+        await self._client.set(key, payload, px=int(self.ttl * 1000))
+
+    async def delete(self, key: str):
+        await self._client.delete(key)
+
+
+# Handed to followers when the leading load was cancelled with its request
+_ABANDONED = object()
+
+
+class EntityCache:
+    """Read-through cache for single entities with single-flight loading.
+
+    Concurrent misses on the same key share one loader call instead of
+    each hitting the database. If the request running that call is
+    cancelled (deadline, disconnect) the others don't fail with it: one of
+    them runs its own loader instead. A key invalidated while its load is
+    still in flight is not written back, so a write can't be undone by a
+    read that started before it committed.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self._inflight: dict[str, asyncio.Future] = {}
+        # Seconds after which invalidated keys are dropped a second time,
+        # set when reads may come from lagging replicas
+        self.reinvalidate_after = 0.0
+        self._delayed: set[asyncio.Task] = set()
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Optional[dict]]]):
+        value = await self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+
+        while True:
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                return await self._load(key, loader)
+            self.coalesced += 1
+            value = await asyncio.shield(inflight)
+            if value is not _ABANDONED:
+                return value
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Optional[dict]]]):
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            # Our request was cancelled, the followers' weren't: let them retry
+            future.set_result(_ABANDONED)
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark retrieved so a load nobody else awaited doesn't log a warning
+            future.exception()
+            raise
+        else:
+            if value is not None and self._inflight.get(key) is future:
+                await self.backend.set(key, value)
+            future.set_result(value)
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        return value
+
+    async def invalidate(self, key: str):
+        self.invalidations += 1
+        self._inflight.pop(key, None)
+        await self.backend.delete(key)
+        if self.reinvalidate_after:
+            task = asyncio.get_running_loop().create_task(self._invalidate_later(key))
+            self._delayed.add(task)
+            task.add_done_callback(self._delayed.discard)
+
+    async def _invalidate_later(self, key: str):
+        await asyncio.sleep(self.reinvalidate_after)
+        self._inflight.pop(key, None)
+        await self.backend.delete(key)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+        }
+
+
+def entity_key(model, row_id: int) -> str:
+    return f"{model.__tablename__}:{row_id}"
+
+
+async def get_cached(db: AsyncSession, model, row_id: int) -> Optional[dict[str, Any]]:
+    """Fetch one row as a dict, served from the entity cache when possible.
+
+    Only the columns the API may return are loaded and cached, so password
+    hashes never reach the cache backend (a shared Redis, say).
+    """
+    async def load():
+        columns = whitelist(model).columns.values()
+        result = await db.execute(select(*columns).where(model.id == row_id))
+        row = result.mappings().one_or_none()
+        return None if row is None else dict(row)
+
+    return await entity_cache.get_or_load(entity_key(model, row_id), load)
+
+
+async def invalidate(model, *row_ids: int):
+    for row_id in row_ids:
+        await entity_cache.invalidate(entity_key(model, row_id))
+
+
+def _make_backend():
+    kind = os.getenv("ENTITY_CACHE_BACKEND", "memory")
+    ttl = float(os.getenv("ENTITY_CACHE_TTL", 30))
+    if kind == "none":
+        return NullBackend()
+    if kind == "redis":
+        return RedisBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"), ttl)
+    return MemoryBackend(int(os.getenv("ENTITY_CACHE_MAX_ENTRIES", 10000)), ttl)
+
+
+entity_cache = EntityCache(_make_backend())
@@ -0,0 +1,390 @@
+"""Change feed: create/update/delete events pushed to clients as Server-Sent Events.
+
+Triggers (migration a9d4e6f1c257) append every change to ``change_log``
+and NOTIFY the committing transaction's id. Each worker keeps one
+dedicated asyncpg connection LISTENing on that channel, fetches the
+transaction's rows once and fans the encoded events out to its
+subscribers. Event ids are change_log ids, so a client reconnecting with
+``Last-Event-ID`` is replayed what it missed from the table.
+
+Ids are allocated at INSERT but published at COMMIT, so transactions
+committing out of order deliver them out of order, and a change with a
+lower id than the client's last event may still be on its way. Resuming
+therefore replays from CATCH_UP_OVERLAP ids further back: delivery is at
+least once, and clients drop repeats by (table, id, version).
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from functools import lru_cache
+from typing import AsyncIterator, Deque, Dict, FrozenSet, List, Optional, Set, Tuple
+
+import orjson
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from cache import invalidate
+from database import get_engine, get_settings
+from metrics import CHANGE_EVENTS, CHANGE_SUBSCRIBERS, CHANGE_SUBSCRIBERS_DROPPED
+from models import BoardGame, Book, Comic, Movie, User
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "changes"
+
+MODELS = {model.__tablename__: model for model in (User, Book, Movie, BoardGame, Comic)}
+
+# Events buffered per subscriber; a client further behind is disconnected
+# and catches up from change_log when it reconnects
+MAX_QUEUE = int(os.getenv("CHANGES_MAX_QUEUE", 1000))
+MAX_SUBSCRIBERS = int(os.getenv("CHANGES_MAX_SUBSCRIBERS", 1000))
+# Most events replayed to a resuming client before it is told to reset
+MAX_REPLAY = int(os.getenv("CHANGES_MAX_REPLAY", 10000))
+HEARTBEAT = float(os.getenv("CHANGES_HEARTBEAT", 15))
+RETENTION_HOURS = float(os.getenv("CHANGES_RETENTION_HOURS", 24))
+PRUNE_INTERVAL = float(os.getenv("CHANGES_PRUNE_INTERVAL", 300))
+
+# Advisory lock held while pruning, so only one process does the work
+PRUNE_LOCK = 0x4348
+
+# ids allocated before a transaction commits can arrive after higher ones;
+# catch-ups and resumed streams re-read this many ids back, and the
+# recently delivered ids below filter out the feed's own repeats
+CATCH_UP_OVERLAP = 1000
+RECENT_IDS = 10000
+# Beyond this many missed events, subscribers are sent back to change_log
+CATCH_UP_LIMIT = 10000
+
+EVENT_COLUMNS = "id, table_name, op, row_id, version, changed_at"
+BY_XACT = f"SELECT {EVENT_COLUMNS} FROM change_log WHERE xact_id = $1 ORDER BY id"
+SINCE = f"SELECT {EVENT_COLUMNS} FROM change_log WHERE id > $1 ORDER BY id"
+
+# Sent when a stream can't be resumed: the client should refetch what it
+# shows, then carry on with the events that follow
+RESET = b"event: reset\ndata: {}\n\n"
+
+Event = Tuple[int, str, bytes]
+
+
+def encode(row) -> Event:
+    """(id, table, SSE frame) for one change_log row, encoded once for every subscriber"""
+    data = orjson.dumps({
+        "table": row["table_name"],
+        "op": row["op"],
+        "id": row["row_id"],
+        "version": row["version"],
+        "changed_at": row["changed_at"],
+    })
+    frame = b"id: %d\nevent: %s\ndata: %s\n\n" % (row["id"], row["op"].encode(), data)
+    return row["id"], row["table_name"], frame
+
+
+class Subscriber:
+    """One open stream: a bounded queue of frames, None once it is dropped"""
+
+    def __init__(self, tables: Optional[FrozenSet[str]], max_queue: int):
+        self.tables = tables
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self.dropped = False
+
+    def offer(self, event: Event):
+        event_id, table, _ = event
+        if self.dropped or (self.tables is not None and table not in self.tables):
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow: free its backlog and end the stream; the client
+            # resumes from its last event id without holding our memory
+            self.drop()
+            CHANGE_SUBSCRIBERS_DROPPED.inc()
+
+    def drop(self):
+        self.dropped = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class ChangeFeed:
+    """One LISTEN connection per worker, fanned out to every subscriber.
+
+    The connection is re-established with backoff when it drops, catching
+    up from change_log on what was committed in between. Entity cache
+    entries of updated and deleted rows are invalidated here too, so other
+    workers' in-process caches don't serve them until their TTL expires.
+    """
+
+    def __init__(self, dsn: str, connect_kwargs: dict, max_queue: int, max_subscribers: int,
+                 prune_interval: float, retention_hours: float):
+        self.dsn = dsn
+        self.connect_kwargs = connect_kwargs
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self.prune_interval = prune_interval
+        self.retention_hours = retention_hours
+        self.subscribers: Set[Subscriber] = set()
+        self.connected = False
+        # Set by close(): the server is shutting down
+        self.closing = False
+        self.last_id: Optional[int] = None
+        self._recent: Deque[int] = deque()
+        self._recent_ids: Set[int] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks) and not self._tasks[0].done()
+
+    def start(self):
+        """Start listening, and pruning change_log, in the background"""
+        if self.running:
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks = [
+            loop.create_task(self._run()),
+            loop.create_task(prune_periodically(get_engine(), self.prune_interval, self.retention_hours)),
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._drop_all()
+
+    def close(self):
+        """End every stream and accept no new ones, as soon as shutdown starts.
+
+        Streams never finish on their own, and the server only runs the
+        lifespan shutdown (and so stop()) once all connections have closed.
+        """
+        self.closing = True
+        self._drop_all()
+
+    def subscribe(self, tables: Optional[FrozenSet[str]]) -> Optional[Subscriber]:
+        if self.closing or len(self.subscribers) >= self.max_subscribers:
+            return None
+        subscriber = Subscriber(tables, self.max_queue)
+        self.subscribers.add(subscriber)
+        CHANGE_SUBSCRIBERS.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.discard(subscriber)
+            CHANGE_SUBSCRIBERS.dec()
+
+    def stats(self) -> Dict[str, int]:
+        return {"subscribers": len(self.subscribers), "connected": int(self.connected)}
+
+    def _drop_all(self):
+        # Their clients reconnect and replay from change_log
+        for subscriber in list(self.subscribers):
+            if not subscriber.dropped:
+                subscriber.drop()
+
+    async def _run(self):
+        delay = 0.5
+        while True:
+            started = time.monotonic()
+            try:
+                await self._listen()
+                logger.warning("Change feed connection closed, reconnecting")
+            except Exception as exc:
+                logger.warning("Change feed connection failed, reconnecting: %s", exc)
+            # Back off only while connections keep failing right away
+            delay = 0.5 if time.monotonic() - started > 30 else min(delay * 2, 30)
+            await asyncio.sleep(delay)
+
+    async def _listen(self):
+        # Imported here like the rest of the database stack, not at startup
+        import asyncpg
+
+        connection = await asyncpg.connect(self.dsn, timeout=10, **self.connect_kwargs)
+        # Transaction ids in commit order; None once the connection is lost
+        committed: asyncio.Queue = asyncio.Queue()
+        connection.add_termination_listener(lambda _: committed.put_nowait(None))
+        getter = None
+        try:
+            await connection.add_listener(
+                CHANNEL, lambda _connection, _pid, _channel, payload: committed.put_nowait(payload))
+            self.connected = True
+            if self.last_id is None:
+                self.last_id = await connection.fetchval("SELECT coalesce(max(id), 0) FROM change_log")
+            else:
+                # Whatever was committed while nobody here was listening
+                rows = await connection.fetch(
+                    f"{SINCE} LIMIT $2", self.last_id - CATCH_UP_OVERLAP, CATCH_UP_LIMIT)
+                if len(rows) == CATCH_UP_LIMIT:
+                    self._drop_all()
+                    self.last_id = await connection.fetchval("SELECT coalesce(max(id), 0) FROM change_log")
+                else:
+                    await self._publish(rows)
+
+            while True:
+                if getter is None:
+                    getter = asyncio.ensure_future(committed.get())
+                done, _ = await asyncio.wait({getter}, timeout=HEARTBEAT)
+                if not done:
+                    # A quiet channel looks just like a dead connection
+                    await asyncio.wait_for(connection.execute("SELECT 1"), HEARTBEAT)
+                    continue
+                payload = getter.result()
+                getter = None
+                if payload is None:
+                    return
+                await self._publish(await connection.fetch(BY_XACT, int(payload)))
+        finally:
+            self.connected = False
+            if getter is not None:
+                getter.cancel()
+            connection.terminate()
+
+    def _seen(self, event_id: int) -> bool:
+        if event_id in self._recent_ids:
+            return True
+        self._recent.append(event_id)
+        self._recent_ids.add(event_id)
+        if len(self._recent) > RECENT_IDS:
+            self._recent_ids.discard(self._recent.popleft())
+        return False
+
+    async def _publish(self, rows):
+        for row in rows:
+            if self._seen(row["id"]):
+                continue
+            CHANGE_EVENTS.labels(row["table_name"]).inc()
+            if row["op"] != "create":
+                await invalidate(MODELS[row["table_name"]], row["row_id"])
+            event = encode(row)
+            for subscriber in list(self.subscribers):
+                subscriber.offer(event)
+            self.last_id = max(self.last_id or 0, row["id"])
+
+
+def parse_tables(tables: Optional[str]) -> Optional[FrozenSet[str]]:
+    """The ``tables`` query parameter as a set, None to follow every table"""
+    if tables is None:
+        return None
+    followed = frozenset(name.strip() for name in tables.split(",") if name.strip())
+    unknown = followed - MODELS.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown tables: {', '.join(sorted(unknown))}"
+        )
+    return followed
+
+
+async def _replay(engine: AsyncEngine, last_event_id: int, tables: Optional[FrozenSet[str]]):
+    """Events the client may have missed, or None when they are no longer all there.
+
+    Starts CATCH_UP_OVERLAP ids before ``last_event_id``: a transaction that
+    committed after the client's last event may hold lower ids.
+    """
+    async with engine.connect() as conn:
+        # Ids have gaps (rolled back transactions), so only the client's own
+        # last event having been pruned proves events were lost
+        oldest = await conn.scalar(text("SELECT min(id) FROM change_log"))
+        if oldest is None or oldest > last_event_id:
+            return None
+        result = await conn.execute(
+            text(f"SELECT {EVENT_COLUMNS} FROM change_log WHERE id > :after ORDER BY id LIMIT :limit"),
+            {"after": last_event_id - CATCH_UP_OVERLAP, "limit": CATCH_UP_OVERLAP + MAX_REPLAY + 1},
+        )
+        rows = result.mappings().all()
+    if len(rows) > CATCH_UP_OVERLAP + MAX_REPLAY:
+        return None
+    return [encode(row) for row in rows if tables is None or row["table_name"] in tables]
+
+
+async def stream(
+    feed: ChangeFeed, subscriber: Subscriber, last_event_id: Optional[int]
+) -> AsyncIterator[bytes]:
+    """The SSE body for one subscriber, replaying from ``last_event_id`` first"""
+    getter = None
+    try:
+        yield b"retry: 2000\n\n"
+        replayed: Set[int] = set()
+        if last_event_id is not None:
+            # Subscribed first, so nothing committed during the replay is lost;
+            # events it delivers are skipped when they arrive live
+            events = await _replay(get_engine(), last_event_id, subscriber.tables)
+            if events is None:
+                yield RESET
+            else:
+                for event_id, _, frame in events:
+                    replayed.add(event_id)
+                    if event_id <= last_event_id:
+                        # Maybe already seen; sent without its id line so the
+                        # client's Last-Event-ID doesn't move back
+                        frame = frame.split(b"\n", 1)[1]
+                    yield frame
+
+        while True:
+            if getter is None:
+                getter = asyncio.ensure_future(subscriber.queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=HEARTBEAT)
+            if not done:
+                # Keeps proxies from closing an idle stream
+                yield b": keepalive\n\n"
+                continue
+            event = getter.result()
+            getter = None
+            if event is None:
+                return
+            event_id, _, frame = event
+            if event_id not in replayed:
+                yield frame
+    finally:
+        if getter is not None:
+            getter.cancel()
+        feed.unsubscribe(subscriber)
+
+
+async def prune(engine: AsyncEngine, retention_hours: float) -> Optional[int]:
+    """Delete change_log rows older than the retention, None if another process is at it"""
+    async with engine.begin() as conn:
+        locked = await conn.scalar(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": PRUNE_LOCK})
+        if not locked:
+            return None
+        result = await conn.execute(
+            text("DELETE FROM change_log WHERE changed_at < now() - make_interval(secs => :seconds)"),
+            {"seconds": retention_hours * 3600},
+        )
+    return result.rowcount
+
+
+async def prune_periodically(engine: AsyncEngine, interval: float, retention_hours: float):
+    # Aligned to the wall clock like stats.reconcile_periodically
+    while True:
+        await asyncio.sleep(interval - time.time() % interval)
+        try:
+            deleted = await prune(engine, retention_hours)
+            if deleted:
+                logger.info("Pruned %d change_log rows", deleted)
+        except Exception:
+            logger.exception("Pruning change_log failed")
+
+
+@lru_cache(maxsize=None)
+def get_change_feed() -> Optional[ChangeFeed]:
+    """This worker's feed, None unless the database is PostgreSQL.
+
+    LISTEN needs a session that stays on one server connection, so with
+    a transaction-pooling PgBouncer point CHANGES_DATABASE_URL at
+    PostgreSQL directly.
+    """
+    settings = get_settings()
+    url = make_url(os.getenv("CHANGES_DATABASE_URL") or settings.url)
+    if url.get_backend_name() != "postgresql":
+        return None
+    dsn = url.set(drivername="postgresql").render_as_string(hide_password=False)
+    server_settings = {"application_name": f"{settings.application_name}_changes"}
+    return ChangeFeed(dsn, {"server_settings": server_settings}, MAX_QUEUE, MAX_SUBSCRIBERS,
+                      PRUNE_INTERVAL, RETENTION_HOURS)
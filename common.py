@@ -0,0 +1,12 @@
+from datetime import date, datetime
+
+# Methods that never change data: read routing, admission and deadlines
+# all treat them as reads
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+def json_default(value):
+    """``default=`` for json.dumps: dates and datetimes as ISO 8601"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
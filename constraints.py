@@ -0,0 +1,36 @@
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def violated_constraint(exc: IntegrityError) -> Optional[str]:
+    """Name of the constraint behind an IntegrityError, if the driver reports it"""
+    # SQLAlchemy's asyncpg adapter chains the original asyncpg error
+    # (UniqueViolationError, ForeignKeyViolationError, ...) as __cause__
+    driver_error = getattr(exc.orig, "__cause__", None)
+    return getattr(driver_error, "constraint_name", None)
+
+
+@asynccontextmanager
+async def constraint_errors(db: AsyncSession, messages: dict[str, str]):
+    """Turn known constraint violations raised inside the block into 400s.
+
+    Writes go straight to the database and let the unique and foreign key
+    constraints reject bad data, instead of probing with SELECTs first.
+    ``messages`` maps constraint names to the error detail returned to the
+    client; violations of any other constraint propagate unchanged.
+    """
+    try:
+        yield
+    except IntegrityError as exc:
+        await db.rollback()
+        detail = messages.get(violated_constraint(exc))
+        if detail is None:
+            raise
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=detail
+        ) from exc
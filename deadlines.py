@@ -0,0 +1,216 @@
+import asyncio
+import os
+import re
+from contextvars import ContextVar
+from typing import List, Optional, Pattern, Tuple
+
+import orjson
+from sqlalchemy.exc import DBAPIError
+
+from common import SAFE_METHODS
+from metrics import REQUESTS_CANCELLED
+
+# Clients may ask for a shorter deadline than the route's default, in seconds
+DEADLINE_HEADER = b"x-request-timeout"
+
+# Per-route defaults, first match wins; None means no deadline
+ROUTE_TIMEOUTS: List[Tuple[Pattern, Optional[float]]] = [
+    # Streams a whole table, runs as long as the client keeps reading
+    (re.compile(r"^/[^/]+/export/?$"), None),
+    (re.compile(r"^/(metrics|ready)/?$"), None),
+    # Server-Sent Events, open until the client leaves
+    (re.compile(r"^/changes/?$"), None),
+    (re.compile(r"^/search/?$"), float(os.getenv("REQUEST_TIMEOUT_SEARCH", 5))),
+]
+READ_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT_READ", 10))
+WRITE_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT_WRITE", 30))
+
+# Session statement_timeout unless DB_STATEMENT_TIMEOUT_MS says otherwise:
+# the longest route default, so no route needs to raise it per transaction
+DEFAULT_STATEMENT_TIMEOUT_MS = int(1000 * max(
+    READ_TIMEOUT, WRITE_TIMEOUT, *(timeout for _, timeout in ROUTE_TIMEOUTS if timeout is not None)
+))
+
+# PostgreSQL's query_canceled, raised when statement_timeout fires
+QUERY_CANCELED = "57014"
+
+# Absolute loop time by which the current request must be answered
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+# Whether X-Request-Timeout made that deadline shorter than the route's
+_shortened: ContextVar[bool] = ContextVar("request_deadline_shortened", default=False)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current request's deadline, None without one"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - asyncio.get_running_loop().time()
+
+
+def apply_statement_timeout(connection, session_default_ms: int):
+    """``SET LOCAL statement_timeout`` for a deadline the client shortened.
+
+    Called as each transaction begins. Route defaults are covered by the
+    session's statement_timeout (reads are also cancelled at their
+    deadline), so only a shorter ``X-Request-Timeout`` costs a statement,
+    and only while it is still tighter than the session's.
+    """
+    left = remaining()
+    if left is None or not _shortened.get() or connection.dialect.name != "postgresql":
+        return
+    timeout_ms = max(1, int(left * 1000))
+    if session_default_ms and session_default_ms <= timeout_ms:
+        return
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
+
+
+def is_query_canceled(exc: BaseException) -> bool:
+    if not isinstance(exc, DBAPIError):
+        return False
+    # The asyncpg error is chained as __cause__, see constraints.violated_constraint
+    driver_error = getattr(exc.orig, "__cause__", None)
+    return getattr(driver_error, "sqlstate", None) == QUERY_CANCELED
+
+
+def route_timeout(method: str, path: str) -> Optional[float]:
+    for pattern, timeout in ROUTE_TIMEOUTS:
+        if pattern.match(path):
+            return timeout
+    return READ_TIMEOUT if method in SAFE_METHODS else WRITE_TIMEOUT
+
+
+def _requested(scope) -> Optional[float]:
+    for name, value in scope["headers"]:
+        if name == DEADLINE_HEADER:
+            try:
+                requested = float(value)
+            except ValueError:
+                return None
+            return requested if requested > 0 else None
+    return None
+
+
+async def _timeout_response(send):
+    body = orjson.dumps({"detail": "Request deadline exceeded"})
+    await send({
+        "type": "http.response.start",
+        "status": 504,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class DeadlineMiddleware:
+    """Gives every request a deadline and stops work nobody will read.
+
+    The deadline is the route's default, or shorter if the client sends
+    ``X-Request-Timeout: <seconds>``. It reaches PostgreSQL as
+    ``statement_timeout``, the session's or, for a shortened deadline, one
+    set per transaction (see ``apply_statement_timeout``), so a slow
+    statement is cancelled server side and answered with 504.
+
+    Read handlers are also cancelled outright when the deadline
+    passes or the client disconnects; asyncpg then cancels the running
+    query and the connection goes back to the pool. Writes are never
+    cancelled mid-flight, only their statements time out, so a commit is
+    either applied or rolled back by PostgreSQL.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timeout = route_timeout(scope["method"], scope["path"])
+        if timeout is None:
+            await self.app(scope, receive, send)
+            return
+        requested = _requested(scope)
+        shortened = requested is not None and requested < timeout
+        if shortened:
+            timeout = requested
+
+        loop = asyncio.get_running_loop()
+        token = _deadline.set(loop.time() + timeout)
+        shortened_token = _shortened.set(shortened)
+        started = False
+
+        async def send_wrapper(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            if scope["method"] not in SAFE_METHODS:
+                try:
+                    await self.app(scope, receive, send_wrapper)
+                except Exception as exc:
+                    if started or not is_query_canceled(exc):
+                        raise
+                    REQUESTS_CANCELLED.labels("deadline").inc()
+                    await _timeout_response(send)
+                return
+            await self._cancellable(scope, receive, send, send_wrapper, timeout, lambda: started)
+        finally:
+            _shortened.reset(shortened_token)
+            _deadline.reset(token)
+
+    async def _cancellable(self, scope, receive, send, send_wrapper, timeout, started):
+        # GET bodies are empty: read them now so the next receive() can only
+        # be the client disconnecting, and replay them to the app
+        pending = []
+        while True:
+            message = await receive()
+            pending.append(message)
+            if message["type"] == "http.disconnect" or not message.get("more_body"):
+                break
+        if pending[-1]["type"] == "http.disconnect":
+            return
+
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+
+        async def replay():
+            if pending:
+                return pending.pop(0)
+            await asyncio.shield(disconnected)
+            return {"type": "http.disconnect"}
+
+        handler = asyncio.ensure_future(self.app(scope, replay, send_wrapper))
+        try:
+            done, _ = await asyncio.wait({handler, disconnected}, timeout=timeout,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if handler in done:
+                exc = handler.exception()
+                if exc is None:
+                    return
+                if started() or not is_query_canceled(exc):
+                    raise exc
+                REQUESTS_CANCELLED.labels("deadline").inc()
+                await _timeout_response(send)
+                return
+
+            reason = "disconnect" if disconnected in done else "deadline"
+            REQUESTS_CANCELLED.labels(reason).inc()
+            handler.cancel()
+            # Let the session roll back and return its connection first
+            await asyncio.gather(handler, return_exceptions=True)
+            if reason == "deadline" and not started():
+                await _timeout_response(send)
+        finally:
+            if not handler.done():
+                handler.cancel()
+                await asyncio.gather(handler, return_exceptions=True)
+            disconnected.cancel()
+
+    async def _wait_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
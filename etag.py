@@ -0,0 +1,53 @@
+import hashlib
+from typing import Any, Optional
+
+from fastapi import Request, Response
+
+
+def entity_etag(entity: dict[str, Any]) -> str:
+    """Weak ETag from the row's id and update counter, no body hashing needed"""
+    return f'W/"{entity["id"]}.{entity["version"]}"'
+
+
+def collection_etag(page: dict[str, Any], fields: Optional[str] = None) -> str:
+    """Weak ETag for one page of a collection, from its rows' versions.
+
+    ``fields`` is the requested projection: the same rows rendered with
+    other columns are a different representation and get another tag.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for item in page["items"]:
+        digest.update(f"{item['id']}.{item['version']};".encode())
+    digest.update((page["next_cursor"] or "").encode())
+    if fields is not None:
+        # id is always returned, and column order doesn't change the body
+        names = sorted({name.strip() for name in fields.split(",") if name.strip()} - {"id"})
+        digest.update(f"|fields={','.join(names)}".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def _opaque(tag: str) -> str:
+    # If-None-Match uses weak comparison, so W/"x" and "x" are equal
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return _opaque(etag) in {_opaque(tag) for tag in header.split(",")}
+
+
+def conditional(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """Return a bodiless 304 when the client already holds ``etag``.
+
+    Otherwise the ETag is set on ``response`` and None is returned, so the
+    route goes on to return its normal body.
+    """
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return None
@@ -0,0 +1,75 @@
+import csv
+import io
+import json
+from typing import AsyncIterator
+
+from fastapi import Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.future import select
+
+from common import json_default
+from database import AsyncSessionLocal
+
+# Rows fetched from the server-side cursor per round trip
+EXPORT_CHUNK_SIZE = 1000
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _encode_ndjson(rows) -> str:
+    return "".join(json.dumps(dict(row), default=json_default) + "\n" for row in rows)
+
+
+def _encode_csv(rows, header=None) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header is not None:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+async def _stream_table(model, fmt: str, bind: AsyncEngine) -> AsyncIterator[str]:
+    columns = list(model.__table__.columns)
+    query = (
+        select(*columns)
+        .order_by(model.id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+
+    # The request-scoped session from get_db is closed once the route returns,
+    # before the body is sent, so the stream owns its own session.
+    async with AsyncSessionLocal(bind=bind) as db:
+        result = await db.stream(query)
+        if fmt == "csv":
+            yield _encode_csv([], header=[column.name for column in columns])
+            async for partition in result.partitions():
+                yield _encode_csv(partition)
+        else:
+            async for partition in result.mappings().partitions():
+                yield _encode_ndjson(partition)
+
+
+def export_response(model, fmt: str, bind: AsyncEngine) -> StreamingResponse:
+    """Stream every row of ``model`` as NDJSON or CSV, one chunk at a time.
+
+    Rows come from a server-side cursor in ``EXPORT_CHUNK_SIZE`` batches and
+    are encoded straight from column tuples without building ORM objects,
+    so memory stays flat regardless of table size.
+    """
+    filename = f"{model.__tablename__}.{fmt}"
+    return StreamingResponse(
+        _stream_table(model, fmt, bind),
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+def export_format(
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$")
+) -> str:
+    return fmt
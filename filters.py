@@ -0,0 +1,108 @@
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import Column
+
+# Never selectable, filterable or sortable through the API
+HIDDEN_COLUMNS = {"password"}
+
+# Column types that also get __gte / __lte range filters
+RANGE_TYPES = (int, datetime)
+
+# Query parameters that are not filters
+RESERVED_PARAMS = {"limit", "cursor", "sort", "fields", "total"}
+
+
+def _bad_request(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+class Whitelist:
+    """What a list route may select, filter and sort on, derived from the model.
+
+    Every mapped column except ``HIDDEN_COLUMNS`` is exposed. String columns
+    get an equality filter, integer and datetime columns also get
+    ``<column>__gte`` and ``<column>__lte``.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.columns: dict[str, Column] = {
+            column.key: column
+            for column in model.__table__.columns
+            if column.key not in HIDDEN_COLUMNS
+        }
+        self.filters: dict[str, Tuple[Column, str]] = {}
+        for name, column in self.columns.items():
+            self.filters[name] = (column, "eq")
+            if column.type.python_type in RANGE_TYPES:
+                self.filters[f"{name}__gte"] = (column, "gte")
+                self.filters[f"{name}__lte"] = (column, "lte")
+
+    def coerce(self, column: Column, raw: Any) -> Any:
+        if raw is None:
+            return None
+        try:
+            return _adapter(column.type.python_type).validate_python(raw)
+        except ValidationError:
+            raise _bad_request(f"Invalid value for {column.key}: {raw!r}")
+
+    def where(self, query_params) -> List[Any]:
+        clauses = []
+        for name in query_params.keys():
+            if name in RESERVED_PARAMS:
+                continue
+            if name not in self.filters:
+                raise _bad_request(f"Unknown filter: {name}")
+            column, op = self.filters[name]
+            values = [self.coerce(column, raw) for raw in query_params.getlist(name)]
+            if op == "gte":
+                clauses.append(column >= max(values))
+            elif op == "lte":
+                clauses.append(column <= min(values))
+            elif len(values) == 1:
+                clauses.append(column == values[0])
+            else:
+                clauses.append(column.in_(values))
+        return clauses
+
+    def sort_keys(self, sort: Optional[str]) -> List[Tuple[Column, bool]]:
+        """Parse ``-rating,title`` into (column, descending) pairs ending in id"""
+        keys = []
+        for part in (sort or "").split(","):
+            part = part.strip()
+            if not part:
+                continue
+            descending = part.startswith("-")
+            name = part.lstrip("-")
+            if name not in self.columns:
+                raise _bad_request(f"Cannot sort by: {name}")
+            keys.append((self.columns[name], descending))
+            if name == "id":
+                # id is unique, later keys could never break a tie
+                return keys
+        # id breaks ties so every row has a unique position for the cursor
+        keys.append((self.columns["id"], False))
+        return keys
+
+    def fields(self, fields: Optional[str]) -> Optional[List[str]]:
+        if fields is None:
+            return None
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in self.columns]
+        if unknown:
+            raise _bad_request(f"Unknown fields: {', '.join(unknown)}")
+        return names
+
+
+@lru_cache(maxsize=None)
+def _adapter(python_type) -> TypeAdapter:
+    return TypeAdapter(python_type)
+
+
+@lru_cache(maxsize=None)
+def whitelist(model) -> Whitelist:
+    return Whitelist(model)
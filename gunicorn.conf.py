@@ -0,0 +1,89 @@
+# Production server: gunicorn managing uvicorn workers.
+#   gunicorn main:app -c gunicorn.conf.py
+import math
+import os
+import shutil
+
+from dotenv import load_dotenv
+
+# Once, in the master; workers inherit the environment. Variables already
+# set (docker compose, the orchestrator) win over .env.
+load_dotenv()
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+worker_class = "uvicorn_worker.UvicornWorker"
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().split()
+    except OSError:
+        return None
+
+
+def _cpu_quota():
+    """CPUs allowed by the cgroup CPU quota (docker --cpus, k8s limits), None if unlimited"""
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    fields = _read("/sys/fs/cgroup/cpu.max")
+    if fields and fields[0] != "max":
+        return int(fields[0]) / int(fields[1])
+    # cgroup v1: a quota of -1 means unlimited
+    quota = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota[0]) > 0:
+        return int(quota[0]) / int(period[0])
+    return None
+
+
+def available_cpus():
+    """CPUs this process may actually use: its affinity mask, then the quota.
+
+    cpu_count() reports every core on the host, however few the container
+    is allowed to run on.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    quota = _cpu_quota()
+    if quota is not None:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+
+# Async workers don't block on I/O, one per usable core keeps every core
+# busy without oversubscribing; bcrypt runs in each worker's own thread pool
+workers = int(os.getenv("WEB_CONCURRENCY") or available_cpus())
+# Workers size their connection pools from this, see settings.py
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
+# Each worker builds its own engine; connections must never cross a fork
+preload_app = False
+
+# On SIGTERM workers stop accepting, finish in-flight requests for up to
+# graceful_timeout seconds, then run the lifespan shutdown
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+timeout = int(os.getenv("WORKER_TIMEOUT", 60))
+keepalive = int(os.getenv("KEEPALIVE", 5))
+
+# Heartbeat files on tmpfs, a disk-backed /tmp can stall workers in containers
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+accesslog = os.getenv("ACCESS_LOG", "-")
+errorlog = "-"
+
+# Workers share Prometheus samples through files in this directory; it
+# must be set before any worker imports prometheus_client
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc"
+)
+
+
+def on_starting(server):
+    # Samples left by a previous run would be added to this one's
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
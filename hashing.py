@@ -0,0 +1,103 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from profiling import record_hashing
+
+
+@lru_cache(maxsize=None)
+def pwd_context():
+    # passlib is slow to import and probes for a bcrypt backend on first use,
+    # so neither happens at import time; PasswordHasher.warm() does it early
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _load_backend():
+    pwd_context().handler().get_backend()
+
+
+class HashingBusyError(Exception):
+    """Raised when the hashing queue is full and the request should be shed"""
+
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded thread pool so it never blocks the event loop.
+
+    bcrypt releases the GIL while it works, so a small thread pool gives real
+    parallelism without the pickling cost of a process pool. ``max_workers``
+    caps how many hashes run at once; ``max_queue`` caps how many more may
+    wait for a worker before callers get ``HashingBusyError``.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="bcrypt"
+        )
+        # Created on first use so it binds to the server's running loop
+        self._slots = None
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def _run(self, fn, *args):
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise HashingBusyError("Password hashing queue is full")
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+        self.queued += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.queued -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        start = time.perf_counter()
+        try:
+            return await self._run(pwd_context().hash, password)
+        finally:
+            # Queue wait included, that is what the request paid
+            record_hashing(time.perf_counter() - start)
+
+    async def warm(self):
+        """Load passlib and its bcrypt backend off the event loop"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, _load_backend)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+hasher = PasswordHasher(
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", 4)),
+    max_queue=int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 64)),
+)
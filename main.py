@@ -1,29 +1,209 @@
-from fastapi import FastAPI, HTTPException, Depends, status
-from sqlalchemy.ext.asyncio import AsyncSession
-from models import Book, User, Movie, BoardGame, Comic
-from database import get_db
+import asyncio
+import signal
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy.future import select
-from datetime import datetime
-from passlib.context import CryptContext
+from sqlalchemy.orm import selectinload
+from models import Book, User, Movie, BoardGame, Comic
+from database import BatchLoader, dispose_engines, get_db, get_engine, get_loader, get_read_db, get_read_engine, get_read_replicas, warm_pools
+from pagination import ListParams, page_response, paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from search import search_catalogs
+from export import export_format, export_response
+from bulk import bulk_upsert
+from constraints import constraint_errors
+from mutations import delete_returning, update_returning
+from cache import get_cached, invalidate
+from etag import collection_etag, conditional, entity_etag
+from datetime import date, datetime
+from hashing import HashingBusyError, hasher
+from metrics import PrometheusMiddleware, render_metrics
+from profiling import ProfilingMiddleware
+from admission import AdmissionMiddleware, admission
+from deadlines import DeadlineMiddleware
+from changes import get_change_feed, parse_tables, stream
+from stats import RECONCILE_INTERVAL, Catalog, genre_stats, month_stats, reconcile_periodically, row_totals, set_total_headers, user_stats
+from replicas import ReadYourWritesMiddleware
 from schemas import UserCreate, UserUpdate, BookCreate, BookUpdate, MovieCreate, MovieUpdate, BoardGameCreate, BoardGameUpdate, ComicCreate, ComicUpdate
+from schemas import UserRead, BookRead, MovieRead, BoardGameRead, ComicRead, UserPage, BookPage, MoviePage, BoardGamePage, ComicPage, BulkItemResult, Message, SearchPage, UserCollection
+from schemas import CatalogStats, GenreStats, MonthStats
+
+def on_shutdown_signal(callback):
+    """Call ``callback`` on the event loop as soon as the server is told to stop.
+
+    Uvicorn, on its own or in gunicorn's UvicornWorker, handles SIGTERM and
+    SIGINT itself (gunicorn's worker_int hook never runs) and only reaches
+    the lifespan shutdown after every connection has closed. Its handlers
+    are chained, not replaced.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        # Signal handlers can only be set from the main thread
+        return
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            loop.call_soon_threadsafe(callback)
+            previous(signum, frame)
+
+        signal.signal(sig, handler)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connect and load bcrypt before taking traffic, not on the first requests
+    await asyncio.gather(warm_pools(), hasher.warm())
+    reconciler = None
+    if RECONCILE_INTERVAL:
+        reconciler = asyncio.ensure_future(reconcile_periodically(get_engine(), RECONCILE_INTERVAL))
+    feed = get_change_feed()
+    if feed is not None:
+        feed.start()
+        # End the streams when shutdown starts, draining would wait on them
+        on_shutdown_signal(feed.close)
+    yield
+    # Runs after the server has drained in-flight requests
+    if feed is not None:
+        await feed.stop()
+    if reconciler is not None:
+        reconciler.cancel()
+        await asyncio.gather(reconciler, return_exceptions=True)
+    await dispose_engines()
+    hasher.shutdown()
+
+# orjson renders the validated response models much faster than json.dumps
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+app.add_middleware(ReadYourWritesMiddleware, replicas=get_read_replicas)
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(AdmissionMiddleware, controller=admission)
+app.add_middleware(PrometheusMiddleware)
+
+# Most users a single batched collection request may ask for
+MAX_COLLECTION_IDS = 100
+
+# One query per relationship, however many items each user owns
+COLLECTION_OPTIONS = (
+    selectinload(User.books),
+    selectinload(User.movies),
+    selectinload(User.board_games),
+    selectinload(User.comics),
+)
+
+# Constraint name -> error detail for writes that violate it
+USER_ERRORS = {
+    "uq_username": "Username already taken",
+    "uq_user_email": "Email already registered",
+}
+USER_UPDATE_ERRORS = {
+    "uq_username": "Username already taken by another user",
+    "uq_user_email": "Email already registered by another user",
+}
+USER_DELETE_ERRORS = {
+    "books_user_id_fkey": "User still owns books",
+    "movies_user_id_fkey": "User still owns movies",
+    "board_games_user_id_fkey": "User still owns board games",
+    "comics_user_id_fkey": "User still owns comics",
+}
+BOOK_ERRORS = {
+    "uq_book_title": "Book with this title already exists",
+    "books_user_id_fkey": "Specified user does not exist",
+}
+MOVIE_ERRORS = {
+    "uq_movie_title": "Movie with this title already exists",
+    "movies_user_id_fkey": "Specified user does not exist",
+}
+GAME_ERRORS = {
+    "uq_game_title": "Game with this title already exists",
+    "board_games_user_id_fkey": "Specified user does not exist",
+}
+COMIC_ERRORS = {
+    "uq_comic_title": "Comic with this title already exists",
+    "comics_user_id_fkey": "Specified user does not exist",
+}
+
+
+@app.exception_handler(HashingBusyError)
+async def hashing_busy_handler(request: Request, exc: HashingBusyError):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": "1"}
+    )
 
-app = FastAPI()
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Prometheus scrape endpoint
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    # Load balancer readiness: out of rotation while this worker is saturated
+    reasons = admission.saturation()
+    if reasons:
+        return ORJSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "saturated", "reasons": reasons, "admission": admission.stats()}
+        )
+    return {"status": "ready", "admission": admission.stats()}
+
+@app.get("/users", response_model=UserPage)
+async def users(
+    request: Request,
+    response: Response,
+    params: ListParams = Depends(),
+    db: AsyncSession = Depends(get_read_db)
+):
+    result = await paginate(db, User, params)
+
+    # Skip serialization when the client's copy of this page is current
+    not_modified = conditional(request, response, collection_etag(result, params.fields))
+    if not_modified is not None:
+        return not_modified
+    if params.total:
+        # From the summary tables or the planner, never COUNT(*)
+        await set_total_headers(db, User, params.query_params, response)
+    return page_response(User, result, params, response)
+
+@app.get("/users/collections", response_model=List[UserCollection])
+async def get_user_collections(
+    ids: List[int] = Query(..., max_length=MAX_COLLECTION_IDS),
+    db: AsyncSession = Depends(get_read_db)
+):
+    # Load several users with all their items in five queries total
+    result = await db.execute(
+        select(User).options(*COLLECTION_OPTIONS).where(User.id.in_(ids)))
+    found = {user.id: user for user in result.scalars().all()}
+
+    # Keep the requested order, skipping ids that don't exist
+    return [found[user_id] for user_id in dict.fromkeys(ids) if user_id in found]
+
+@app.get("/users/{user_id}", response_model=UserRead)
+async def get_user(user_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
+    # Get single user by ID
+    user = await get_cached(db, User, user_id)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+    # Check if user exists
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
 
-@app.get("/users")
-async def users(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(User))
-    users = result.scalars().all()
-    return users
+    # Answer 304 when the client already has this version
+    not_modified = conditional(request, response, entity_etag(user))
+    if not_modified is not None:
+        return not_modified
+    return user
 
-@app.get("/users/{user_id}")
-async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
-    # Get single book by ID
-    result = await db.execute(select(User).where(User.id == user_id))
+@app.get("/users/{user_id}/collection", response_model=UserCollection)
+async def get_user_collection(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    # Get a user with all their books, movies, board games and comics
+    result = await db.execute(
+        select(User).options(*COLLECTION_OPTIONS).where(User.id == user_id))
     user = result.scalar_one_or_none()
 
     # Check if user exists
@@ -31,27 +211,10 @@ async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
-@app.post("/users")
+@app.post("/users", response_model=UserRead)
 async def add_user(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
-    # Check if username already exists
-    existing_user = await db.execute(select(User).where(User.username == user_data.username))
-    if existing_user.scalar_one_or_none() is not None:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already taken"
-        )
-
-    # Check if email already exists
-    existing_email = await db.execute(
-        select(User).where(User.email == user_data.email))
-    if existing_email.scalar_one_or_none() is not None:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
-
     # Hash the password
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await hasher.hash(user_data.password)
 
     # Create new user
     new_user = User(
@@ -64,118 +227,84 @@ async def add_user(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     )
 
     db.add(new_user)
-    await db.commit()
-    await db.refresh(new_user)
+    async with constraint_errors(db, USER_ERRORS):
+        await db.commit()
     return new_user
 
 
-@app.put("/users/{user_id}")
+@app.put("/users/{user_id}", response_model=UserRead)
 async def update_user(user_id: int, user_data: UserUpdate, db: AsyncSession = Depends(get_db)):
-    # Get the user
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
-
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-
-    # Check if new username is taken by another user
-    if user_data.username and user_data.username != user.username:
-        existing_user = await db.execute(
-            select(User).where(
-                (User.username == user_data.username) &
-                (User.id != user_id)  # Exclude current user
-            )
-        )
-        if existing_user.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Username already taken by another user"
-            )
-
-    # Check if new email is taken by another user
-    if user_data.email and user_data.email != user.email:
-        existing_email = await db.execute(
-            select(User).where(
-                (User.email == user_data.email) &
-                (User.id != user_id)  # Exclude current user
-            )
-        )
-        if existing_email.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already registered by another user"
-            )
-
-    # Update only provided fields
+    # Update only provided fields in a single UPDATE ... RETURNING
     update_data = user_data.model_dump(exclude_unset=True)
 
     if "password" in update_data:
-        update_data["password"] = get_password_hash(update_data["password"])
-
-    for field, value in update_data.items():
-        setattr(user, field, value)
+        update_data["password"] = await hasher.hash(update_data["password"])
 
-    await db.commit()
-    await db.refresh(user)
+    async with constraint_errors(db, USER_UPDATE_ERRORS):
+        user = await update_returning(db, User, user_id, update_data)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found"
+            )
+        await db.commit()
+    await invalidate(User, user_id)
     return user
 
-@app.delete("/users/{user_id}")
+@app.delete("/users/{user_id}", response_model=Message)
 async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
-    # Delete a user
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalar_one_or_none()
-
-    # Check if user exists
-    if user is None:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    await db.delete(user)
-    await db.commit()
+    # Delete a user in a single DELETE ... RETURNING
+    async with constraint_errors(db, USER_DELETE_ERRORS):
+        deleted_id = await delete_returning(db, User, user_id)
+        if deleted_id is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        await db.commit()
+    await invalidate(User, user_id)
     return {"message": "User deleted successfully"}
 
 
-@app.get("/books")
-async def get_books(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Book))
-    books = result.scalars().all()
-    return books
-
-
-@app.get("/books/{book_id}")
-async def get_book(book_id: int, db: AsyncSession = Depends(get_db)):
+@app.get("/books", response_model=BookPage)
+async def get_books(
+    request: Request,
+    response: Response,
+    params: ListParams = Depends(),
+    db: AsyncSession = Depends(get_read_db)
+):
+    result = await paginate(db, Book, params)
+
+    # Skip serialization when the client's copy of this page is current
+    not_modified = conditional(request, response, collection_etag(result, params.fields))
+    if not_modified is not None:
+        return not_modified
+    if params.total:
+        # From the summary tables or the planner, never COUNT(*)
+        await set_total_headers(db, Book, params.query_params, response)
+    return page_response(Book, result, params, response)
+
+
+@app.get("/books/export")
+async def export_books(fmt: str = Depends(export_format), bind: AsyncEngine = Depends(get_read_engine)):
+    # Stream the whole table as NDJSON or CSV
+    return export_response(Book, fmt, bind)
+
+@app.get("/books/{book_id}", response_model=BookRead)
+async def get_book(book_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
     # Get single book by ID
-    result = await db.execute(select(Book).where(Book.id == book_id))
-    book = result.scalar_one_or_none()
+    book = await get_cached(db, Book, book_id)
 
     # Check if book exists
     if book is None:
         raise HTTPException(status_code=404, detail="Book not found")
+
+    # Answer 304 when the client already has this version
+    not_modified = conditional(request, response, entity_etag(book))
+    if not_modified is not None:
+        return not_modified
     return book
 
 
-@app.post("/books")
+@app.post("/books", response_model=BookRead)
 async def add_book(book_data: BookCreate, db: AsyncSession = Depends(get_db)):
-    # Check if book title already exists
-    existing_book = await db.execute(select(Book).where(Book.title == book_data.title))
-    if existing_book.scalar_one_or_none() is not None:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Book with this title already exists"
-        )
-
-    # Verify user exists if user_id is provided
-    if book_data.user_id:
-        user_exists = await db.execute(
-            select(User).where(User.id == book_data.user_id))
-        if not user_exists.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Specified user does not exist"
-            )
-
     # Create new book in database
     new_book = Book(
         title=book_data.title,
@@ -188,107 +317,93 @@ async def add_book(book_data: BookCreate, db: AsyncSession = Depends(get_db)):
     )
 
     db.add(new_book)
-    await db.commit()
-    await db.refresh(new_book)
+    async with constraint_errors(db, BOOK_ERRORS):
+        await db.commit()
     return new_book
 
 
-@app.put("/books/{book_id}")
-async def update_book(book_id: int, book_data: BookUpdate, db: AsyncSession = Depends(get_db)):
-    # Get the book
-    result = await db.execute(select(Book).where(Book.id == book_id))
-    book = result.scalar_one_or_none()
-
-    if not book:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Book not found"
-        )
+@app.post("/books/bulk", response_model=List[BulkItemResult])
+async def add_books_bulk(
+    books_data: List[BookCreate],
+    on_conflict: str = Query("skip", pattern="^(skip|update)$"),
+    db: AsyncSession = Depends(get_db),
+    loader: BatchLoader = Depends(get_loader)
+):
+    # Insert (or upsert by title) the whole batch in one statement
+    return await bulk_upsert(
+        db, loader, Book, books_data, on_conflict,
+        conflict_detail="Book with this title already exists",
+        errors=BOOK_ERRORS
+    )
 
-    # Check if title is being changed and would conflict
-    if book_data.title and book_data.title != book.title:
-        existing_book = await db.execute(
-            select(Book).where(
-                (Book.title == book_data.title) &
-                (Book.id != book_id)  # Exclude current book
-            )
-        )
-        if existing_book.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Book with this title already exists"
-            )
+@app.put("/books/{book_id}", response_model=BookRead)
+async def update_book(book_id: int, book_data: BookUpdate, db: AsyncSession = Depends(get_db)):
+    # Update only provided fields in a single UPDATE ... RETURNING
+    update_data = book_data.model_dump(exclude_unset=True)
 
-    # Check if new user_id exists
-    if book_data.user_id is not None and book_data.user_id != book.user_id:
-        user_exists = await db.execute(
-            select(User).where(User.id == book_data.user_id))
-        if not user_exists.scalar_one_or_none():
+    async with constraint_errors(db, BOOK_ERRORS):
+        book = await update_returning(db, Book, book_id, update_data)
+        if book is None:
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Specified user does not exist"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Book not found"
             )
-
-    # Update only provided fields
-    update_data = book_data.model_dump(exclude_unset=True)
-
-    for field, value in update_data.items():
-        setattr(book, field, value)
-
-    await db.commit()
-    await db.refresh(book)
+        await db.commit()
+    await invalidate(Book, book_id)
     return book
 
 
-@app.delete("/books/{book_id}")
+@app.delete("/books/{book_id}", response_model=Message)
 async def delete_book(book_id: int, db: AsyncSession = Depends(get_db)):
-    # Delete a book
-    result = await db.execute(select(Book).where(Book.id == book_id))
-    book = result.scalar_one_or_none()
-    if book is None:
+    # Delete a book in a single DELETE ... RETURNING
+    deleted_id = await delete_returning(db, Book, book_id)
+    if deleted_id is None:
         raise HTTPException(status_code=404, detail="Book not found")
 
-    await db.delete(book)
     await db.commit()
+    await invalidate(Book, book_id)
     return {"message": "Book deleted successfully"}
 
-@app.get("/movies")
-async def get_movies(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Movie))
-    movies = result.scalars().all()
-    return movies
-
-@app.get("/movies/{movie_id}")
-async def get_movie(movie_id: int, db: AsyncSession = Depends(get_db)):
-    # Get single book by ID
-    result = await db.execute(select(Movie).where(Movie.id == movie_id))
-    movie = result.scalar_one_or_none()
+@app.get("/movies", response_model=MoviePage)
+async def get_movies(
+    request: Request,
+    response: Response,
+    params: ListParams = Depends(),
+    db: AsyncSession = Depends(get_read_db)
+):
+    result = await paginate(db, Movie, params)
+
+    # Skip serialization when the client's copy of this page is current
+    not_modified = conditional(request, response, collection_etag(result, params.fields))
+    if not_modified is not None:
+        return not_modified
+    if params.total:
+        # From the summary tables or the planner, never COUNT(*)
+        await set_total_headers(db, Movie, params.query_params, response)
+    return page_response(Movie, result, params, response)
+
+@app.get("/movies/export")
+async def export_movies(fmt: str = Depends(export_format), bind: AsyncEngine = Depends(get_read_engine)):
+    # Stream the whole table as NDJSON or CSV
+    return export_response(Movie, fmt, bind)
+
+@app.get("/movies/{movie_id}", response_model=MovieRead)
+async def get_movie(movie_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
+    # Get single movie by ID
+    movie = await get_cached(db, Movie, movie_id)
 
     # Check if movie exists
     if movie is None:
         raise HTTPException(status_code=404, detail="Movie not found")
+
+    # Answer 304 when the client already has this version
+    not_modified = conditional(request, response, entity_etag(movie))
+    if not_modified is not None:
+        return not_modified
     return movie
 
-@app.post("/movies")
+@app.post("/movies", response_model=MovieRead)
 async def add_movie(movie_data: MovieCreate, db: AsyncSession = Depends(get_db)):
-    # Check if movie title already exists
-    existing_movie = await db.execute(select(Movie).where(Movie.title == movie_data.title))
-    if existing_movie.scalar_one_or_none() is not None:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Movie with this title already exists"
-        )
-
-    # Verify user exists if user_id is provided
-    if movie_data.user_id:
-        user_exists = await db.execute(
-            select(User).where(User.id == movie_data.user_id))
-        if not user_exists.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Specified user does not exist"
-            )
-
     # Create new movie in database
     new_movie = Movie(
         title=movie_data.title,
@@ -301,107 +416,91 @@ async def add_movie(movie_data: MovieCreate, db: AsyncSession = Depends(get_db))
     )
 
     db.add(new_movie)
-    await db.commit()
-    await db.refresh(new_movie)
+    async with constraint_errors(db, MOVIE_ERRORS):
+        await db.commit()
     return new_movie
 
-@app.put("/movies/{movie_id}")
-async def update_movie(movie_id: int, movie_data: MovieUpdate, db: AsyncSession = Depends(get_db)):
-    # Get the book
-    result = await db.execute(select(Movie).where(Movie.id == movie_id))
-    movie = result.scalar_one_or_none()
-
-    if not movie:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Movie not found"
-        )
+@app.post("/movies/bulk", response_model=List[BulkItemResult])
+async def add_movies_bulk(
+    movies_data: List[MovieCreate],
+    on_conflict: str = Query("skip", pattern="^(skip|update)$"),
+    db: AsyncSession = Depends(get_db),
+    loader: BatchLoader = Depends(get_loader)
+):
+    # Insert (or upsert by title) the whole batch in one statement
+    return await bulk_upsert(
+        db, loader, Movie, movies_data, on_conflict,
+        conflict_detail="Movie with this title already exists",
+        errors=MOVIE_ERRORS
+    )
 
-    # Check if title is being changed and would conflict
-    if movie_data.title and movie_data.title != movie.title:
-        existing_movie = await db.execute(
-            select(Movie).where(
-                (Movie.title == movie_data.title) &
-                (Movie.id != movie_id)  # Exclude current book
-            )
-        )
-        if existing_movie.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Movie with this title already exists"
-            )
+@app.put("/movies/{movie_id}", response_model=MovieRead)
+async def update_movie(movie_id: int, movie_data: MovieUpdate, db: AsyncSession = Depends(get_db)):
+    # Update only provided fields in a single UPDATE ... RETURNING
+    update_data = movie_data.model_dump(exclude_unset=True)
 
-    # Check if new user_id exists
-    if movie_data.user_id is not None and movie_data.user_id != movie.user_id:
-        user_exists = await db.execute(
-            select(User).where(User.id == movie_data.user_id))
-        if not user_exists.scalar_one_or_none():
+    async with constraint_errors(db, MOVIE_ERRORS):
+        movie = await update_returning(db, Movie, movie_id, update_data)
+        if movie is None:
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Specified user does not exist"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Movie not found"
             )
-
-    # Update only provided fields
-    update_data = movie_data.model_dump(exclude_unset=True)
-
-    for field, value in update_data.items():
-        setattr(movie, field, value)
-
-    await db.commit()
-    await db.refresh(movie)
+        await db.commit()
+    await invalidate(Movie, movie_id)
     return movie
 
-@app.delete("/movies/{movie_id}")
+@app.delete("/movies/{movie_id}", response_model=Message)
 async def delete_movie(movie_id: int, db: AsyncSession = Depends(get_db)):
-    # Delete a movie
-    result = await db.execute(select(Movie).where(Movie.id == movie_id))
-    movie = result.scalar_one_or_none()
-
-    # Check if movie exists
-    if movie is None:
+    # Delete a movie in a single DELETE ... RETURNING
+    deleted_id = await delete_returning(db, Movie, movie_id)
+    if deleted_id is None:
         raise HTTPException(status_code=404, detail="Movie not found")
 
-    await db.delete(movie)
     await db.commit()
+    await invalidate(Movie, movie_id)
     return {"message": "Movie deleted successfully"}
 
-@app.get("/board_games")
-async def board_games(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(BoardGame))
-    games = result.scalars().all()
-    return games
-
-@app.get("/board_games/{game_id}")
-async def get_game(game_id: int, db: AsyncSession = Depends(get_db)):
+@app.get("/board_games", response_model=BoardGamePage)
+async def board_games(
+    request: Request,
+    response: Response,
+    params: ListParams = Depends(),
+    db: AsyncSession = Depends(get_read_db)
+):
+    result = await paginate(db, BoardGame, params)
+
+    # Skip serialization when the client's copy of this page is current
+    not_modified = conditional(request, response, collection_etag(result, params.fields))
+    if not_modified is not None:
+        return not_modified
+    if params.total:
+        # From the summary tables or the planner, never COUNT(*)
+        await set_total_headers(db, BoardGame, params.query_params, response)
+    return page_response(BoardGame, result, params, response)
+
+@app.get("/board_games/export")
+async def export_games(fmt: str = Depends(export_format), bind: AsyncEngine = Depends(get_read_engine)):
+    # Stream the whole table as NDJSON or CSV
+    return export_response(BoardGame, fmt, bind)
+
+@app.get("/board_games/{game_id}", response_model=BoardGameRead)
+async def get_game(game_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
     # Get single game by ID
-    result = await db.execute(select(BoardGame).where(BoardGame.id == game_id))
-    game = result.scalar_one_or_none()
+    game = await get_cached(db, BoardGame, game_id)
 
     # Check if game exists
     if game is None:
         raise HTTPException(status_code=404, detail="Game not found")
+
+    # Answer 304 when the client already has this version
+    not_modified = conditional(request, response, entity_etag(game))
+    if not_modified is not None:
+        return not_modified
     return game
 
-@app.post("/board_games")
+@app.post("/board_games", response_model=BoardGameRead)
 async def add_game(game_data: BoardGameCreate, db: AsyncSession = Depends(get_db)):
-    # Check if game title already exists
-    existing_game = await db.execute(select(BoardGame).where(BoardGame.title == game_data.title))
-    if existing_game.scalar_one_or_none() is not None:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Game with this title already exists"
-        )
-
-    # Verify user exists if user_id is provided
-    if game_data.user_id:
-        user_exists = await db.execute(
-            select(User).where(User.id == game_data.user_id))
-        if not user_exists.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Specified user does not exist"
-            )
-
     # Create new game in database
     new_game = BoardGame(
         title=game_data.title,
@@ -413,107 +512,91 @@ async def add_game(game_data: BoardGameCreate, db: AsyncSession = Depends(get_db
     )
 
     db.add(new_game)
-    await db.commit()
-    await db.refresh(new_game)
+    async with constraint_errors(db, GAME_ERRORS):
+        await db.commit()
     return new_game
 
-@app.put("/board_games/{game_id}")
-async def update_game(game_id: int, game_data: BoardGameUpdate, db: AsyncSession = Depends(get_db)):
-    # Get the game
-    result = await db.execute(select(BoardGame).where(BoardGame.id == game_id))
-    game = result.scalar_one_or_none()
-
-    if not game:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Game not found"
-        )
+@app.post("/board_games/bulk", response_model=List[BulkItemResult])
+async def add_games_bulk(
+    games_data: List[BoardGameCreate],
+    on_conflict: str = Query("skip", pattern="^(skip|update)$"),
+    db: AsyncSession = Depends(get_db),
+    loader: BatchLoader = Depends(get_loader)
+):
+    # Insert (or upsert by title) the whole batch in one statement
+    return await bulk_upsert(
+        db, loader, BoardGame, games_data, on_conflict,
+        conflict_detail="Game with this title already exists",
+        errors=GAME_ERRORS
+    )
 
-    # Check if title is being changed and would conflict
-    if game_data.title and game_data.title != game.title:
-        existing_game = await db.execute(
-            select(BoardGame).where(
-                (BoardGame.title == game_data.title) &
-                (BoardGame.id != game_id)  # Exclude current book
-            )
-        )
-        if existing_game.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Game with this title already exists"
-            )
+@app.put("/board_games/{game_id}", response_model=BoardGameRead)
+async def update_game(game_id: int, game_data: BoardGameUpdate, db: AsyncSession = Depends(get_db)):
+    # Update only provided fields in a single UPDATE ... RETURNING
+    update_data = game_data.model_dump(exclude_unset=True)
 
-    # Check if new user_id exists
-    if game_data.user_id is not None and game_data.user_id != game.user_id:
-        user_exists = await db.execute(
-            select(User).where(User.id == game_data.user_id))
-        if not user_exists.scalar_one_or_none():
+    async with constraint_errors(db, GAME_ERRORS):
+        game = await update_returning(db, BoardGame, game_id, update_data)
+        if game is None:
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Specified user does not exist"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Game not found"
             )
-
-    # Update only provided fields
-    update_data = game_data.model_dump(exclude_unset=True)
-
-    for field, value in update_data.items():
-        setattr(game, field, value)
-
-    await db.commit()
-    await db.refresh(game)
+        await db.commit()
+    await invalidate(BoardGame, game_id)
     return game
 
-@app.delete("/board_games/{game_id}")
+@app.delete("/board_games/{game_id}", response_model=Message)
 async def delete_game(game_id: int, db: AsyncSession = Depends(get_db)):
-    # Delete a game
-    result = await db.execute(select(BoardGame).where(BoardGame.id == game_id))
-    game = result.scalar_one_or_none()
-
-    # Check if game exists
-    if game is None:
+    # Delete a game in a single DELETE ... RETURNING
+    deleted_id = await delete_returning(db, BoardGame, game_id)
+    if deleted_id is None:
         raise HTTPException(status_code=404, detail="Game not found")
 
-    await db.delete(game)
     await db.commit()
+    await invalidate(BoardGame, game_id)
     return {"message": "Game deleted successfully"}
 
-@app.get("/comics")
-async def get_comics(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Comic))
-    comics = result.scalars().all()
-    return comics
-
-@app.get("/comics/{game_id}")
-async def get_comic(comic_id: int, db: AsyncSession = Depends(get_db)):
+@app.get("/comics", response_model=ComicPage)
+async def get_comics(
+    request: Request,
+    response: Response,
+    params: ListParams = Depends(),
+    db: AsyncSession = Depends(get_read_db)
+):
+    result = await paginate(db, Comic, params)
+
+    # Skip serialization when the client's copy of this page is current
+    not_modified = conditional(request, response, collection_etag(result, params.fields))
+    if not_modified is not None:
+        return not_modified
+    if params.total:
+        # From the summary tables or the planner, never COUNT(*)
+        await set_total_headers(db, Comic, params.query_params, response)
+    return page_response(Comic, result, params, response)
+
+@app.get("/comics/export")
+async def export_comics(fmt: str = Depends(export_format), bind: AsyncEngine = Depends(get_read_engine)):
+    # Stream the whole table as NDJSON or CSV
+    return export_response(Comic, fmt, bind)
+
+@app.get("/comics/{comic_id}", response_model=ComicRead)
+async def get_comic(comic_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
     # Get single comic by ID
-    result = await db.execute(select(Comic).where(Comic.id == comic_id))
-    comic = result.scalar_one_or_none()
+    comic = await get_cached(db, Comic, comic_id)
 
     # Check if comic exists
     if comic is None:
         raise HTTPException(status_code=404, detail="Comic not found")
+
+    # Answer 304 when the client already has this version
+    not_modified = conditional(request, response, entity_etag(comic))
+    if not_modified is not None:
+        return not_modified
     return comic
 
-@app.post("/comics")
+@app.post("/comics", response_model=ComicRead)
 async def add_comic(comic_data: ComicCreate, db: AsyncSession = Depends(get_db)):
-    # Check if comic title already exists
-    existing_comic = await db.execute(select(Comic).where(Comic.title == comic_data.title))
-    if existing_comic.scalar_one_or_none() is not None:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Comic with this title already exists"
-        )
-
-    # Verify user exists if user_id is provided
-    if comic_data.user_id:
-        user_exists = await db.execute(
-            select(User).where(User.id == comic_data.user_id))
-        if not user_exists.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Specified user does not exist"
-            )
-
     # Create new comic in database
     new_comic = Comic(
         title=comic_data.title,
@@ -525,66 +608,110 @@ async def add_comic(comic_data: ComicCreate, db: AsyncSession = Depends(get_db))
     )
 
     db.add(new_comic)
-    await db.commit()
-    await db.refresh(new_comic)
+    async with constraint_errors(db, COMIC_ERRORS):
+        await db.commit()
     return new_comic
 
-@app.put("/comics/{comic_id}")
-async def update_comic(comic_id: int, comic_data: ComicUpdate, db: AsyncSession = Depends(get_db)):
-    # Get the comic
-    result = await db.execute(select(Comic).where(Comic.id == comic_id))
-    comic = result.scalar_one_or_none()
-
-    if not comic:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Comic not found"
-        )
+@app.post("/comics/bulk", response_model=List[BulkItemResult])
+async def add_comics_bulk(
+    comics_data: List[ComicCreate],
+    on_conflict: str = Query("skip", pattern="^(skip|update)$"),
+    db: AsyncSession = Depends(get_db),
+    loader: BatchLoader = Depends(get_loader)
+):
+    # Insert (or upsert by title) the whole batch in one statement
+    return await bulk_upsert(
+        db, loader, Comic, comics_data, on_conflict,
+        conflict_detail="Comic with this title already exists",
+        errors=COMIC_ERRORS
+    )
 
-    # Check if title is being changed and would conflict
-    if comic_data.title and comic_data.title != comic.title:
-        existing_comic = await db.execute(
-            select(Comic).where(
-                (Comic.title == comic_data.title) &
-                (Comic.id != comic_id)  # Exclude current book
-            )
-        )
-        if existing_comic.scalar_one_or_none():
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Comic with this title already exists"
-            )
+@app.put("/comics/{comic_id}", response_model=ComicRead)
+async def update_comic(comic_id: int, comic_data: ComicUpdate, db: AsyncSession = Depends(get_db)):
+    # Update only provided fields in a single UPDATE ... RETURNING
+    update_data = comic_data.model_dump(exclude_unset=True)
 
-    # Check if new user_id exists
-    if comic_data.user_id is not None and comic_data.user_id != comic.user_id:
-        user_exists = await db.execute(
-            select(User).where(User.id == comic_data.user_id))
-        if not user_exists.scalar_one_or_none():
+    async with constraint_errors(db, COMIC_ERRORS):
+        comic = await update_returning(db, Comic, comic_id, update_data)
+        if comic is None:
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Specified user does not exist"
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Comic not found"
             )
-
-    # Update only provided fields
-    update_data = comic_data.model_dump(exclude_unset=True)
-
-    for field, value in update_data.items():
-        setattr(comic, field, value)
-
-    await db.commit()
-    await db.refresh(comic)
+        await db.commit()
+    await invalidate(Comic, comic_id)
     return comic
 
-@app.delete("/comics/{comic_id}")
+@app.delete("/comics/{comic_id}", response_model=Message)
 async def delete_comic(comic_id: int, db: AsyncSession = Depends(get_db)):
-    # Delete a comic
-    result = await db.execute(select(Comic).where(Comic.id == comic_id))
-    comic = result.scalar_one_or_none()
-
-    # Check if comic exists
-    if comic is None:
+    # Delete a comic in a single DELETE ... RETURNING
+    deleted_id = await delete_returning(db, Comic, comic_id)
+    if deleted_id is None:
         raise HTTPException(status_code=404, detail="Comic not found")
 
-    await db.delete(comic)
     await db.commit()
-    return {"message": "Comic deleted successfully"}
\ No newline at end of file
+    await invalidate(Comic, comic_id)
+    return {"message": "Comic deleted successfully"}
+
+@app.get("/search", response_model=SearchPage)
+async def search(
+    q: str = Query(..., min_length=2, max_length=100),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_read_db)
+):
+    # Ranked full-text and fuzzy search across books, movies, board games and comics
+    return await search_catalogs(db, q, limit, cursor)
+
+
+@app.get("/stats/totals", response_model=Dict[str, int])
+async def stats_totals(db: AsyncSession = Depends(get_read_db)):
+    # Row count of every table, kept by triggers
+    return await row_totals(db)
+
+@app.get("/stats/users/{user_id}", response_model=List[CatalogStats])
+async def stats_user(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    # Item count and average rating in each catalog the user has items in
+    return await user_stats(db, user_id)
+
+@app.get("/stats/{catalog}/genres", response_model=List[GenreStats])
+async def stats_genres(catalog: Catalog, db: AsyncSession = Depends(get_read_db)):
+    # Item count and average rating per genre
+    return await genre_stats(db, catalog)
+
+@app.get("/stats/{catalog}/months", response_model=List[MonthStats])
+async def stats_months(
+    catalog: Catalog,
+    since: Optional[date] = Query(None, description="First month, any day within it"),
+    until: Optional[date] = Query(None),
+    db: AsyncSession = Depends(get_read_db)
+):
+    # Items added per month, by created_at
+    return await month_stats(db, catalog, since, until)
+
+@app.get("/changes")
+async def changes(
+    tables: Optional[str] = Query(None, description="Comma separated tables to follow, all by default"),
+    after: Optional[int] = Query(None, description="Resume after this event id, like Last-Event-ID"),
+    last_event_id: Optional[int] = Header(None),
+):
+    # Server-Sent Events for every create, update and delete
+    feed = get_change_feed()
+    if feed is None or not feed.running or feed.closing:
+        raise HTTPException(status_code=503, detail="Change feed unavailable")
+
+    subscriber = feed.subscribe(parse_tables(tables))
+    if subscriber is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many change feed subscribers",
+            headers={"Retry-After": "5"}
+        )
+
+    # The header wins: browsers send it on their own when reconnecting
+    resume = last_event_id if last_event_id is not None else after
+    return StreamingResponse(
+        stream(feed, subscriber, resume),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,230 @@
+import math
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from cache import entity_cache
+from hashing import hasher
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being handled",
+    multiprocess_mode="livesum",
+)
+STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds",
+    "Time spent executing SQL statements, by statement type",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the pool",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30),
+)
+
+REQUESTS_CANCELLED = Counter(
+    "http_requests_cancelled",
+    "Requests whose work was stopped early, by deadline or client disconnect",
+    ["reason"],
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected",
+    "Requests shed with 503 by admission control",
+    ["route_class", "reason"],
+)
+ADMISSION_QUEUED = Gauge(
+    "admission_queued",
+    "Requests waiting for an admission slot",
+    ["route_class"],
+    multiprocess_mode="livesum",
+)
+CHANGE_SUBSCRIBERS = Gauge(
+    "change_feed_subscribers",
+    "Open /changes event streams",
+    multiprocess_mode="livesum",
+)
+CHANGE_EVENTS = Counter(
+    "change_feed_events",
+    "Change events received from PostgreSQL",
+    ["table"],
+)
+CHANGE_SUBSCRIBERS_DROPPED = Counter(
+    "change_feed_subscribers_dropped",
+    "Streams closed because the client fell too far behind",
+)
+
+
+class PoolPressure:
+    """Recent pool checkout wait, as an exponentially decaying average.
+
+    The average decays with wall time rather than per checkout, so it
+    falls back to zero even while admission control lets nothing through.
+    """
+
+    def __init__(self, half_life: float = 1.0):
+        self.half_life = half_life
+        self._value = 0.0
+        self._at = time.monotonic()
+
+    def _decayed(self, now: float) -> float:
+        return self._value * math.pow(0.5, (now - self._at) / self.half_life)
+
+    def observe(self, seconds: float):
+        now = time.monotonic()
+        # Equal weight to the past and the new sample
+        self._value = (self._decayed(now) + seconds) / 2
+        self._at = now
+
+    def wait(self) -> float:
+        return self._decayed(time.monotonic())
+
+
+pool_pressure = PoolPressure()
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """The default asyncpg pool, recording how long each checkout waited"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            POOL_CHECKOUT_WAIT.observe(waited)
+            pool_pressure.observe(waited)
+
+
+class _RuntimeCollector:
+    """Reports pool, hashing pool and entity cache state at scrape time"""
+
+    def __init__(self):
+        self.pools = []
+
+    def collect(self):
+        checked_out = GaugeMetricFamily(
+            "db_pool_checked_out", "Connections currently checked out", labels=["pool"])
+        overflow = GaugeMetricFamily(
+            "db_pool_overflow", "Connections open beyond pool_size", labels=["pool"])
+        size = GaugeMetricFamily(
+            "db_pool_size", "Configured pool_size", labels=["pool"])
+        for name, pool in self.pools:
+            checked_out.add_metric([name], pool.checkedout())
+            overflow.add_metric([name], max(pool.overflow(), 0))
+            size.add_metric([name], pool.size())
+        yield checked_out
+        yield overflow
+        yield size
+
+        stats = hasher.stats()
+        yield GaugeMetricFamily(
+            "password_hash_queue_depth", "Password hashes waiting for a worker", value=stats["queued"])
+        yield GaugeMetricFamily(
+            "password_hash_running", "Password hashes in progress", value=stats["running"])
+        yield CounterMetricFamily(
+            "password_hash_completed", "Password hashes finished", value=stats["completed"])
+        yield CounterMetricFamily(
+            "password_hash_rejected", "Password hashes rejected with a full queue", value=stats["rejected"])
+
+        cache_stats = entity_cache.stats()
+        for name in ("hits", "misses", "coalesced", "invalidations"):
+            yield CounterMetricFamily(
+                f"entity_cache_{name}", f"Entity cache {name}", value=cache_stats[name])
+
+
+_runtime = _RuntimeCollector()
+REGISTRY.register(_runtime)
+
+
+def instrument_engine(engine, name: str = "primary"):
+    """Time every statement on ``engine`` and report its pool at scrape time"""
+    sync_engine = engine.sync_engine
+    _runtime.pools.append((name, sync_engine.pool))
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("statement_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["statement_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        STATEMENT_DURATION.labels(operation).observe(time.perf_counter() - started)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _failed(context):
+        starts = context.connection.info.get("statement_start") if context.connection else None
+        if starts:
+            starts.pop()
+
+
+# FastAPI's own pages: plain routes that don't record a template in the scope
+UNTEMPLATED_PATHS = {"/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json"}
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if scope["path"] in UNTEMPLATED_PATHS:
+        return scope["path"]
+    # Routing never ran (shed by admission control, rejected by a
+    # middleware) or found nothing: the raw path is client controlled, so
+    # any status here shares one label to keep cardinality bounded
+    return "unmatched"
+
+
+class PrometheusMiddleware:
+    """ASGI middleware recording per-route latency and in-flight requests.
+
+    Routes are labelled by their template (``/books/{book_id}``), not the
+    raw path, to keep label cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            REQUEST_LATENCY.labels(
+                scope["method"], _route_label(scope), str(status_code)
+            ).observe(time.perf_counter() - start)
+
+
+def render_metrics():
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+    # Under gunicorn: histograms and counters summed over every worker, pool
+    # and cache state from the worker answering this scrape
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(_runtime)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
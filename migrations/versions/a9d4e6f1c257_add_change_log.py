@@ -0,0 +1,84 @@
+"""Add change_log with NOTIFY triggers for the /changes feed
+
+Every insert, update and delete on the users and catalog tables appends
+one row per changed row to change_log and sends a NOTIFY on the
+``changes`` channel carrying the transaction id. Notifications are
+delivered at commit and identical ones within a transaction are folded,
+so listeners get one per committed transaction and fetch its rows by
+xact_id.
+
+Revision ID: a9d4e6f1c257
+Revises: f4c1a8e27b93
+Create Date: 2026-10-18 15:31:48.204716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d4e6f1c257'
+down_revision: Union[str, None] = 'f4c1a8e27b93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ["users", "books", "movies", "board_games", "comics"]
+
+CHANGE_FUNCTION = """
+CREATE FUNCTION change_log_apply() RETURNS trigger LANGUAGE plpgsql AS $function$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO change_log (table_name, op, row_id, version)
+        SELECT TG_TABLE_NAME, 'delete', id, version FROM old_rows ORDER BY id;
+    ELSE
+        INSERT INTO change_log (table_name, op, row_id, version)
+        SELECT TG_TABLE_NAME, CASE TG_OP WHEN 'INSERT' THEN 'create' ELSE 'update' END, id, version
+        FROM new_rows ORDER BY id;
+    END IF;
+    IF FOUND THEN
+        PERFORM pg_notify('changes', txid_current()::text);
+    END IF;
+    RETURN NULL;
+END
+$function$
+"""
+
+
+def upgrade() -> None:
+    op.create_table(
+        "change_log",
+        sa.Column("id", sa.BigInteger(), sa.Identity(), primary_key=True),
+        sa.Column("xact_id", sa.BigInteger(), nullable=False, server_default=sa.text("txid_current()")),
+        sa.Column("table_name", sa.String(50), nullable=False),
+        sa.Column("op", sa.String(6), nullable=False),
+        sa.Column("row_id", sa.Integer(), nullable=False),
+        sa.Column("version", sa.Integer()),
+        sa.Column("changed_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index("ix_change_log_xact_id", "change_log", ["xact_id"])
+    # Append-only, so a tiny BRIN index is enough for pruning by age
+    op.create_index("ix_change_log_changed_at", "change_log", ["changed_at"], postgresql_using="brin")
+
+    op.execute(CHANGE_FUNCTION)
+    for table in TABLES:
+        for event, referencing in (
+            ("INSERT", "NEW TABLE AS new_rows"),
+            ("UPDATE", "NEW TABLE AS new_rows"),
+            ("DELETE", "OLD TABLE AS old_rows"),
+        ):
+            op.execute(
+                f"CREATE TRIGGER {table}_changes_{event.lower()} AFTER {event} ON {table} "
+                f"REFERENCING {referencing} FOR EACH STATEMENT EXECUTE FUNCTION change_log_apply()"
+            )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        for event in ("insert", "update", "delete"):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_changes_{event} ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS change_log_apply()")
+    op.drop_index("ix_change_log_changed_at", table_name="change_log")
+    op.drop_index("ix_change_log_xact_id", table_name="change_log")
+    op.drop_table("change_log")
@@ -0,0 +1,28 @@
+"""Add unique constraint on users.email
+
+Revision ID: b3f1c7d2e9a4
+Revises: 68d246113159
+Create Date: 2026-10-18 11:02:31.412807
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f1c7d2e9a4'
+down_revision: Union[str, None] = '68d246113159'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Build the index without blocking writes, then promote it to a constraint
+    with op.get_context().autocommit_block():
+        op.create_index("uq_user_email", "users", ["email"], unique=True,
+                        postgresql_concurrently=True)
+    op.execute("ALTER TABLE users ADD CONSTRAINT uq_user_email UNIQUE USING INDEX uq_user_email")
+
+def downgrade() -> None:
+    op.drop_constraint("uq_user_email", "users", type_="unique")
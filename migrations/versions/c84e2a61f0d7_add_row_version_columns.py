@@ -0,0 +1,30 @@
+"""Add row version counters
+
+Revision ID: c84e2a61f0d7
+Revises: b3f1c7d2e9a4
+Create Date: 2026-10-18 11:14:52.204519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c84e2a61f0d7'
+down_revision: Union[str, None] = 'b3f1c7d2e9a4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ("users", "books", "movies", "board_games", "comics")
+
+
+def upgrade() -> None:
+    # A constant server default is a metadata-only change, no table rewrite
+    for table in TABLES:
+        op.add_column(table, sa.Column("version", sa.Integer, nullable=False, server_default="1"))
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_column(table, "version")
@@ -0,0 +1,50 @@
+"""Add foreign key, genre and created_at indexes
+
+Revision ID: d29a5f3b7c16
+Revises: c84e2a61f0d7
+Create Date: 2026-10-18 11:31:07.659130
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd29a5f3b7c16'
+down_revision: Union[str, None] = 'c84e2a61f0d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# users.email is already indexed by uq_user_email
+INDEXES = [
+    ("ix_users_created_at", "users", "created_at"),
+    ("ix_books_user_id", "books", "user_id"),
+    ("ix_books_genre", "books", "genre"),
+    ("ix_books_created_at", "books", "created_at"),
+    ("ix_movies_user_id", "movies", "user_id"),
+    ("ix_movies_genre", "movies", "genre"),
+    ("ix_movies_created_at", "movies", "created_at"),
+    ("ix_board_games_user_id", "board_games", "user_id"),
+    ("ix_board_games_genre", "board_games", "genre"),
+    ("ix_board_games_created_at", "board_games", "created_at"),
+    ("ix_comics_user_id", "comics", "user_id"),
+    ("ix_comics_genre", "comics", "genre"),
+    ("ix_comics_created_at", "comics", "created_at"),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY can't run inside a transaction. If a build is interrupted
+    # it leaves an INVALID index: drop it by hand before re-running, since
+    # IF NOT EXISTS only skips the indexes that already exist.
+    with op.get_context().autocommit_block():
+        for name, table, column in INDEXES:
+            op.create_index(name, table, [column], postgresql_concurrently=True,
+                            if_not_exists=True)
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True,
+                          if_exists=True)
@@ -0,0 +1,62 @@
+"""Add full-text and trigram search indexes to the catalog tables
+
+Adding a STORED generated column rewrites the table under an ACCESS
+EXCLUSIVE lock, so run this in a quiet window on large tables. The
+indexes themselves are built CONCURRENTLY.
+
+Revision ID: e7b3d91a4c58
+Revises: d29a5f3b7c16
+Create Date: 2026-10-18 11:52:40.118342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b3d91a4c58'
+down_revision: Union[str, None] = 'd29a5f3b7c16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Catalog table -> column holding the author/director/designer
+CATALOGS = {
+    "books": "author",
+    "movies": "director",
+    "board_games": "designer",
+    "comics": "author",
+}
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, creator in CATALOGS.items():
+        op.execute(
+            f"ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            f"setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+            f"setweight(to_tsvector('simple', coalesce({creator}, '')), 'B')"
+            f") STORED"
+        )
+
+    with op.get_context().autocommit_block():
+        for table, creator in CATALOGS.items():
+            op.create_index(f"ix_{table}_search", table, ["search_vector"],
+                            postgresql_using="gin", postgresql_concurrently=True,
+                            if_not_exists=True)
+            for column in ("title", creator):
+                op.create_index(f"ix_{table}_{column}_trgm", table, [column],
+                                postgresql_using="gin",
+                                postgresql_ops={column: "gin_trgm_ops"},
+                                postgresql_concurrently=True, if_not_exists=True)
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table, creator in CATALOGS.items():
+            for column in ("title", creator):
+                op.drop_index(f"ix_{table}_{column}_trgm", table_name=table,
+                              postgresql_concurrently=True, if_exists=True)
+            op.drop_index(f"ix_{table}_search", table_name=table,
+                          postgresql_concurrently=True, if_exists=True)
+    for table in CATALOGS:
+        op.drop_column(table, "search_vector")
@@ -0,0 +1,258 @@
+"""Add summary tables for catalog statistics and row counts
+
+Statement-level triggers with transition tables keep the summaries up to
+date, one aggregated upsert per summary table per statement however many
+rows it touched. Rows hit by every write (row counts, genres, months) are
+spread over SHARDS rows picked by backend pid, so concurrent writers don't
+queue on one row lock; readers add the shards up.
+
+reconcile_summaries() recomputes everything from the base tables. It
+blocks writes while it runs, so schedule it off-peak.
+
+Revision ID: f4c1a8e27b93
+Revises: e7b3d91a4c58
+Create Date: 2026-10-18 14:07:12.530917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c1a8e27b93'
+down_revision: Union[str, None] = 'e7b3d91a4c58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SHARDS = 8
+
+# Catalog table -> expression for its rating, NULL where it has none
+CATALOGS = {
+    "books": "rating",
+    "movies": "rating",
+    "board_games": "NULL::int",
+    "comics": "NULL::int",
+}
+COUNTED = ["users", *CATALOGS]
+
+SUMMARY_TABLES = ["row_counts", "catalog_genre_stats", "catalog_user_stats", "catalog_month_stats"]
+
+
+def _stat_columns():
+    return [
+        sa.Column("item_count", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("rating_sum", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("rating_count", sa.BigInteger(), nullable=False, server_default="0"),
+    ]
+
+
+# Adds one statement's net change per key to a summary table. Reads the
+# ``delta`` CTE of catalog_stats_apply(): changed rows signed +1 (new) or -1
+# (old). Keys whose change nets out, e.g. an UPDATE that only touched the
+# title, are skipped rather than upserted with zeros.
+UPSERT_STATS = """
+    INSERT INTO {table} AS s (catalog, {key}{shard_column}, item_count, rating_sum, rating_count)
+    SELECT $1, {key}{shard_value}, items, ratings_total, ratings
+    FROM (
+        SELECT {key_expr} AS {key},
+               sum(sign) AS items,
+               coalesce(sum(sign * rating), 0) AS ratings_total,
+               coalesce(sum(sign) FILTER (WHERE rating IS NOT NULL), 0) AS ratings
+        FROM delta
+        {where}
+        GROUP BY 1
+    ) d
+    WHERE (items, ratings_total, ratings) <> (0, 0, 0)
+    ON CONFLICT (catalog, {key}{shard_column}) DO UPDATE SET
+        item_count = s.item_count + excluded.item_count,
+        rating_sum = s.rating_sum + excluded.rating_sum,
+        rating_count = s.rating_count + excluded.rating_count
+"""
+
+
+def _upsert(table: str, key: str, key_expr: str, sharded: bool, where: str = "") -> str:
+    return UPSERT_STATS.format(
+        table=table,
+        key=key,
+        key_expr=key_expr,
+        shard_column=", shard" if sharded else "",
+        shard_value=", $2" if sharded else "",
+        where=where,
+    )
+
+
+STATS_FUNCTION = f"""
+CREATE FUNCTION catalog_stats_apply() RETURNS trigger LANGUAGE plpgsql AS $function$
+DECLARE
+    changed text;
+BEGIN
+    changed := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT 1 AS sign, r.* FROM new_rows r'
+        WHEN 'DELETE' THEN 'SELECT -1 AS sign, r.* FROM old_rows r'
+        ELSE 'SELECT 1 AS sign, r.* FROM new_rows r UNION ALL SELECT -1, r.* FROM old_rows r'
+    END;
+    EXECUTE format($sql$
+        WITH delta AS (
+            SELECT sign, genre, user_id, created_at, %s AS rating FROM (%s) changed
+        ),
+        by_genre AS ({_upsert("catalog_genre_stats", "genre", "genre", sharded=True)}),
+        by_user AS ({_upsert("catalog_user_stats", "user_id", "user_id", sharded=False)})
+        {_upsert("catalog_month_stats", "month", "date_trunc('month', created_at)::date",
+                 sharded=True, where="WHERE created_at IS NOT NULL")}
+    $sql$, TG_ARGV[0], changed)
+    USING TG_TABLE_NAME::text, (pg_backend_pid() % {SHARDS})::smallint;
+    RETURN NULL;
+END
+$function$
+"""
+
+COUNT_FUNCTION = f"""
+CREATE FUNCTION row_count_apply() RETURNS trigger LANGUAGE plpgsql AS $function$
+DECLARE
+    delta bigint;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT count(*) INTO delta FROM new_rows;
+    ELSE
+        SELECT -count(*) INTO delta FROM old_rows;
+    END IF;
+    IF delta <> 0 THEN
+        INSERT INTO row_counts AS c (table_name, shard, row_count)
+        VALUES (TG_TABLE_NAME, pg_backend_pid() % {SHARDS}, delta)
+        ON CONFLICT (table_name, shard) DO UPDATE SET row_count = c.row_count + excluded.row_count;
+    END IF;
+    RETURN NULL;
+END
+$function$
+"""
+
+TRUNCATE_FUNCTION = """
+CREATE FUNCTION summaries_truncate() RETURNS trigger LANGUAGE plpgsql AS $function$
+BEGIN
+    DELETE FROM row_counts WHERE table_name = TG_TABLE_NAME::text;
+    DELETE FROM catalog_genre_stats WHERE catalog = TG_TABLE_NAME::text;
+    DELETE FROM catalog_user_stats WHERE catalog = TG_TABLE_NAME::text;
+    DELETE FROM catalog_month_stats WHERE catalog = TG_TABLE_NAME::text;
+    RETURN NULL;
+END
+$function$
+"""
+
+RECONCILE_FUNCTION = f"""
+CREATE FUNCTION reconcile_summaries() RETURNS void LANGUAGE plpgsql AS $function$
+DECLARE
+    catalog text;
+    rating text;
+BEGIN
+    -- SHARE mode lets reads through but holds writes (and so the triggers)
+    -- until the summaries are rebuilt
+    LOCK TABLE {", ".join(COUNTED)} IN SHARE MODE;
+    DELETE FROM row_counts;
+    DELETE FROM catalog_genre_stats;
+    DELETE FROM catalog_user_stats;
+    DELETE FROM catalog_month_stats;
+
+    INSERT INTO row_counts (table_name, shard, row_count) SELECT 'users', 0, count(*) FROM users;
+    FOR catalog, rating IN
+        SELECT * FROM (VALUES {", ".join(f"('{table}', '{expr}')" for table, expr in CATALOGS.items())}) v
+    LOOP
+        EXECUTE format('INSERT INTO row_counts (table_name, shard, row_count)
+                        SELECT %1$L, 0, count(*) FROM %1$I', catalog);
+        EXECUTE format('INSERT INTO catalog_genre_stats
+                        SELECT %1$L, genre, 0, count(*), coalesce(sum(%2$s), 0), count(%2$s)
+                        FROM %1$I GROUP BY genre', catalog, rating);
+        EXECUTE format('INSERT INTO catalog_user_stats
+                        SELECT %1$L, user_id, count(*), coalesce(sum(%2$s), 0), count(%2$s)
+                        FROM %1$I GROUP BY user_id', catalog, rating);
+        EXECUTE format('INSERT INTO catalog_month_stats
+                        SELECT %1$L, date_trunc(''month'', created_at)::date, 0,
+                               count(*), coalesce(sum(%2$s), 0), count(%2$s)
+                        FROM %1$I WHERE created_at IS NOT NULL GROUP BY 2', catalog, rating);
+    END LOOP;
+END
+$function$
+"""
+
+
+def upgrade() -> None:
+    op.create_table(
+        "row_counts",
+        sa.Column("table_name", sa.String(50), nullable=False),
+        sa.Column("shard", sa.SmallInteger(), nullable=False),
+        sa.Column("row_count", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.PrimaryKeyConstraint("table_name", "shard"),
+    )
+    op.create_table(
+        "catalog_genre_stats",
+        sa.Column("catalog", sa.String(50), nullable=False),
+        sa.Column("genre", sa.String(50), nullable=False),
+        sa.Column("shard", sa.SmallInteger(), nullable=False),
+        *_stat_columns(),
+        sa.PrimaryKeyConstraint("catalog", "genre", "shard"),
+    )
+    op.create_table(
+        "catalog_user_stats",
+        sa.Column("catalog", sa.String(50), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        *_stat_columns(),
+        sa.PrimaryKeyConstraint("catalog", "user_id"),
+    )
+    op.create_table(
+        "catalog_month_stats",
+        sa.Column("catalog", sa.String(50), nullable=False),
+        sa.Column("month", sa.Date(), nullable=False),
+        sa.Column("shard", sa.SmallInteger(), nullable=False),
+        *_stat_columns(),
+        sa.PrimaryKeyConstraint("catalog", "month", "shard"),
+    )
+
+    op.execute(STATS_FUNCTION)
+    op.execute(COUNT_FUNCTION)
+    op.execute(TRUNCATE_FUNCTION)
+    op.execute(RECONCILE_FUNCTION)
+
+    for table in COUNTED:
+        for event, referencing in (
+            ("INSERT", "NEW TABLE AS new_rows"),
+            ("DELETE", "OLD TABLE AS old_rows"),
+        ):
+            op.execute(
+                f"CREATE TRIGGER {table}_count_{event.lower()} AFTER {event} ON {table} "
+                f"REFERENCING {referencing} FOR EACH STATEMENT EXECUTE FUNCTION row_count_apply()"
+            )
+        op.execute(
+            f"CREATE TRIGGER {table}_summaries_truncate AFTER TRUNCATE ON {table} "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION summaries_truncate()"
+        )
+
+    for table, rating in CATALOGS.items():
+        for event, referencing in (
+            ("INSERT", "NEW TABLE AS new_rows"),
+            ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+            ("DELETE", "OLD TABLE AS old_rows"),
+        ):
+            op.execute(
+                f"CREATE TRIGGER {table}_stats_{event.lower()} AFTER {event} ON {table} "
+                f"REFERENCING {referencing} FOR EACH STATEMENT "
+                f"EXECUTE FUNCTION catalog_stats_apply('{rating}')"
+            )
+
+    # Backfill from the existing rows
+    op.execute("SELECT reconcile_summaries()")
+
+
+def downgrade() -> None:
+    for table in CATALOGS:
+        for event in ("insert", "update", "delete"):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_stats_{event} ON {table}")
+    for table in COUNTED:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_summaries_truncate ON {table}")
+        for event in ("insert", "delete"):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_count_{event} ON {table}")
+
+    for function in ("reconcile_summaries", "summaries_truncate", "row_count_apply", "catalog_stats_apply"):
+        op.execute(f"DROP FUNCTION IF EXISTS {function}()")
+    for table in reversed(SUMMARY_TABLES):
+        op.drop_table(table)
@@ -1,77 +1,192 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, func
+from sqlalchemy import BigInteger, Boolean, Column, Date, ForeignKey, Identity, Index, Integer, SmallInteger, String, DateTime, UniqueConstraint, func
 from sqlalchemy.orm import relationship
 from database import Base
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        UniqueConstraint("username", name="uq_username"),
+        UniqueConstraint("email", name="uq_user_email"),
+        Index("ix_users_created_at", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True)
-    name = Column(String(50))
-    username = Column(String(50), unique=True)
-    email = Column(String(100))
-    password = Column(String(100))
+    name = Column(String(50), nullable=False)
+    username = Column(String(50), nullable=False)
+    email = Column(String(100), nullable=False)
+    password = Column(String(100), nullable=False)
     role = Column(String(10))
     created_at = Column(DateTime, default=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
-    books = relationship("Book", back_populates="user")
-    movies = relationship("Movie", back_populates="user")
-    board_games = relationship("BoardGame", back_populates="user")
-    comics = relationship("Comic", back_populates="user")
+    # lazy="raise" makes any implicit (N+1) load an error; load these
+    # explicitly with selectinload()
+    books = relationship("Book", back_populates="user", lazy="raise")
+    movies = relationship("Movie", back_populates="user", lazy="raise")
+    board_games = relationship("BoardGame", back_populates="user", lazy="raise")
+    comics = relationship("Comic", back_populates="user", lazy="raise")
 
 class Book(Base):
     __tablename__ = 'books'
+    __table_args__ = (
+        UniqueConstraint("title", name="uq_book_title"),
+        Index("ix_books_user_id", "user_id"),
+        Index("ix_books_genre", "genre"),
+        Index("ix_books_created_at", "created_at"),
+        Index("ix_books_title_trgm", "title", postgresql_using="gin",
+              postgresql_ops={"title": "gin_trgm_ops"}),
+        Index("ix_books_author_trgm", "author", postgresql_using="gin",
+              postgresql_ops={"author": "gin_trgm_ops"}),
+        # The search_vector generated column and its ix_books_search GIN
+        # index are managed by migration e7b3d91a4c58 and left unmapped
+    )
 
     id = Column(Integer, primary_key=True)
-    title = Column(String(50), unique=True)
-    author = Column(String(50))
-    genre = Column(String(50))
-    published_date = Column(String(10))
+    title = Column(String(50), nullable=False)
+    author = Column(String(50), nullable=False)
+    genre = Column(String(50), nullable=False)
+    published_date = Column(String(10), nullable=False)
     rating = Column(Integer)
     created_at = Column(DateTime, default=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id', name='books_user_id_fkey'), nullable=False)
 
-    user = relationship("User", back_populates="books")
+    user = relationship("User", back_populates="books", lazy="raise")
 
 class Movie(Base):
     __tablename__ = 'movies'
+    __table_args__ = (
+        UniqueConstraint("title", name="uq_movie_title"),
+        Index("ix_movies_user_id", "user_id"),
+        Index("ix_movies_genre", "genre"),
+        Index("ix_movies_created_at", "created_at"),
+        Index("ix_movies_title_trgm", "title", postgresql_using="gin",
+              postgresql_ops={"title": "gin_trgm_ops"}),
+        Index("ix_movies_director_trgm", "director", postgresql_using="gin",
+              postgresql_ops={"director": "gin_trgm_ops"}),
+        # The search_vector generated column and its ix_movies_search GIN
+        # index are managed by migration e7b3d91a4c58 and left unmapped
+    )
 
     id = Column(Integer, primary_key=True)
-    title = Column(String(50))
-    director = Column(String(50))
-    genre = Column(String(50))
-    release_date = Column(String(10))
+    title = Column(String(50), nullable=False)
+    director = Column(String(50), nullable=False)
+    genre = Column(String(50), nullable=False)
+    release_date = Column(String(10), nullable=False)
     rating = Column(Integer)
     created_at = Column(DateTime, default=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id', name='movies_user_id_fkey'), nullable=False)
 
-    user = relationship("User", back_populates="movies")
+    user = relationship("User", back_populates="movies", lazy="raise")
 
 class BoardGame(Base):
     __tablename__ = 'board_games'
+    __table_args__ = (
+        UniqueConstraint("title", name="uq_game_title"),
+        Index("ix_board_games_user_id", "user_id"),
+        Index("ix_board_games_genre", "genre"),
+        Index("ix_board_games_created_at", "created_at"),
+        Index("ix_board_games_title_trgm", "title", postgresql_using="gin",
+              postgresql_ops={"title": "gin_trgm_ops"}),
+        Index("ix_board_games_designer_trgm", "designer", postgresql_using="gin",
+              postgresql_ops={"designer": "gin_trgm_ops"}),
+        # The search_vector generated column and its ix_board_games_search GIN
+        # index are managed by migration e7b3d91a4c58 and left unmapped
+    )
 
     id = Column(Integer, primary_key=True)
-    title = Column(String(50))
-    designer = Column(String(50))
-    genre = Column(String(50))
-    release_date = Column(String(10))
+    title = Column(String(50), nullable=False)
+    designer = Column(String(50), nullable=False)
+    genre = Column(String(50), nullable=False)
+    release_date = Column(String(10), nullable=False)
     created_at = Column(DateTime, default=func.now())
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
-    user_id = Column(Integer, ForeignKey('users.id'))
+    user_id = Column(Integer, ForeignKey('users.id', name='board_games_user_id_fkey'), nullable=False)
 
-    user = relationship("User", back_populates="board_games")
+    user = relationship("User", back_populates="board_games", lazy="raise")
 
 class Comic(Base):
     __tablename__ = 'comics'
+    __table_args__ = (
+        UniqueConstraint("title", name="uq_comic_title"),
+        Index("ix_comics_user_id", "user_id"),
+        Index("ix_comics_genre", "genre"),
+        Index("ix_comics_created_at", "created_at"),
+        Index("ix_comics_title_trgm", "title", postgresql_using="gin",
+              postgresql_ops={"title": "gin_trgm_ops"}),
+        Index("ix_comics_author_trgm", "author", postgresql_using="gin",
+              postgresql_ops={"author": "gin_trgm_ops"}),
+        # The search_vector generated column and its ix_comics_search GIN
+        # index are managed by migration e7b3d91a4c58 and left unmapped
+    )
 
     id = Column(Integer, primary_key=True)
-    title = Column(String(50))
-    author = Column(String(50))
-    genre = Column(String(50))
-    published_date = Column(String(10))
+    title = Column(String(50), nullable=False)
+    author = Column(String(50), nullable=False)
+    genre = Column(String(50), nullable=False)
+    published_date = Column(String(10), nullable=False)
     created_at = Column(DateTime, default=func.now())
-
-    user_id = Column(Integer, ForeignKey('users.id'))
-
-    user = relationship("User", back_populates="comics")
\ No newline at end of file
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    user_id = Column(Integer, ForeignKey('users.id', name='comics_user_id_fkey'), nullable=False)
+
+    user = relationship("User", back_populates="comics", lazy="raise")
+
+# Summary tables maintained by the triggers in migration f4c1a8e27b93; the
+# hot ones are sharded, so always sum over shard
+
+class RowCount(Base):
+    __tablename__ = 'row_counts'
+
+    table_name = Column(String(50), primary_key=True)
+    shard = Column(SmallInteger, primary_key=True)
+    row_count = Column(BigInteger, nullable=False, default=0)
+
+class CatalogGenreStats(Base):
+    __tablename__ = 'catalog_genre_stats'
+
+    catalog = Column(String(50), primary_key=True)
+    genre = Column(String(50), primary_key=True)
+    shard = Column(SmallInteger, primary_key=True)
+    item_count = Column(BigInteger, nullable=False, default=0)
+    rating_sum = Column(BigInteger, nullable=False, default=0)
+    rating_count = Column(BigInteger, nullable=False, default=0)
+
+class CatalogUserStats(Base):
+    __tablename__ = 'catalog_user_stats'
+
+    catalog = Column(String(50), primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    item_count = Column(BigInteger, nullable=False, default=0)
+    rating_sum = Column(BigInteger, nullable=False, default=0)
+    rating_count = Column(BigInteger, nullable=False, default=0)
+
+class CatalogMonthStats(Base):
+    __tablename__ = 'catalog_month_stats'
+
+    catalog = Column(String(50), primary_key=True)
+    month = Column(Date, primary_key=True)
+    shard = Column(SmallInteger, primary_key=True)
+    item_count = Column(BigInteger, nullable=False, default=0)
+    rating_sum = Column(BigInteger, nullable=False, default=0)
+    rating_count = Column(BigInteger, nullable=False, default=0)
+
+class ChangeLog(Base):
+    __tablename__ = 'change_log'
+    __table_args__ = (
+        Index("ix_change_log_changed_at", "changed_at", postgresql_using="brin"),
+    )
+    # Written only by the triggers in migration a9d4e6f1c257, which also
+    # default xact_id to txid_current()
+
+    id = Column(BigInteger, Identity(), primary_key=True)
+    xact_id = Column(BigInteger, nullable=False, index=True)
+    table_name = Column(String(50), nullable=False)
+    op = Column(String(6), nullable=False)
+    row_id = Column(Integer, nullable=False)
+    version = Column(Integer)
+    changed_at = Column(DateTime(timezone=True), nullable=False, default=func.now())
@@ -0,0 +1,32 @@
+from typing import Any, Optional
+
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+
+async def update_returning(db: AsyncSession, model, row_id: int, values: dict[str, Any]):
+    """Apply ``values`` to one row with a single UPDATE ... RETURNING.
+
+    Returns the updated entity, or None when no row has that id.
+    """
+    if not values:
+        # Nothing to change, a plain lookup still gives the 404 semantics
+        result = await db.execute(select(model).where(model.id == row_id))
+        return result.scalar_one_or_none()
+
+    stmt = (
+        update(model)
+        .where(model.id == row_id)
+        .values(**values, version=model.version + 1)
+        .returning(model)
+    )
+    result = await db.execute(stmt, execution_options={"synchronize_session": False})
+    return result.scalar_one_or_none()
+
+
+async def delete_returning(db: AsyncSession, model, row_id: int) -> Optional[int]:
+    """Delete one row with DELETE ... RETURNING id, None when it did not exist"""
+    stmt = delete(model).where(model.id == row_id).returning(model.id)
+    result = await db.execute(stmt, execution_options={"synchronize_session": False})
+    return result.scalar_one_or_none()
@@ -0,0 +1,159 @@
+import base64
+import json
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException, Query, Request, Response, status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import Column, and_, false, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from common import json_default
+from filters import whitelist
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(sort: str, values: List[Any]) -> str:
+    """Encode the sort key values of the last row on a page as an opaque cursor"""
+    raw = json.dumps({"s": sort, "v": values}, separators=(",", ":"), default=json_default)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, size: int) -> List[Any]:
+    """Decode a cursor produced by encode_cursor for the same sort, 400 on anything else"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        values = payload["v"]
+        if payload["s"] != sort or len(values) != size:
+            raise ValueError(payload)
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return values
+
+
+class ListParams:
+    """Query parameters shared by every collection route.
+
+    Any other query parameter is treated as a filter and validated against
+    the model's whitelist, see filters.Whitelist.
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None),
+        sort: Optional[str] = Query(
+            None, description="Comma separated columns, prefix with '-' for descending"
+        ),
+        fields: Optional[str] = Query(
+            None, description="Comma separated columns to return, id is always included"
+        ),
+        total: bool = Query(
+            False, description="Also send X-Total-Count, estimated when X-Total-Count-Estimated is set"
+        ),
+    ):
+        self.query_params = request.query_params
+        self.limit = limit
+        self.cursor = cursor
+        self.sort = sort
+        self.fields = fields
+        self.total = total
+
+
+def _after(column: Column, value: Any, descending: bool):
+    # PostgreSQL's default NULL placement (last ascending, first descending)
+    # matches a plain btree index scanned either way
+    if descending:
+        if value is None:
+            return column.is_not(None)
+        return column < value
+    if value is None:
+        return false()
+    beyond = column > value
+    return or_(beyond, column.is_(None)) if column.nullable else beyond
+
+
+def _equal(column: Column, value: Any):
+    return column.is_(None) if value is None else column == value
+
+
+def _seek(keys: List[Tuple[Column, bool]], values: List[Any]):
+    """WHERE clause selecting the rows after ``values`` in ``keys`` order"""
+    if len(keys) == 1:
+        # Default id ordering seeks with a plain index range
+        (column, descending), = keys
+        return _after(column, values[0], descending)
+    branches = []
+    for position, (column, descending) in enumerate(keys):
+        ties = [_equal(c, v) for (c, _), v in zip(keys[:position], values[:position])]
+        branches.append(and_(*ties, _after(column, values[position], descending)))
+    return or_(*branches)
+
+
+async def paginate(db: AsyncSession, model, params: ListParams) -> dict[str, Any]:
+    """Return one keyset page of ``model`` rows as dicts.
+
+    Seeks past the cursor on the sort keys (always ending in ``id``) instead
+    of using OFFSET, so every page costs the same regardless of how deep the
+    client has paged. Only the requested fields, the sort keys and the
+    ``id``/``version`` pair used for ETags are selected. One extra row is
+    fetched to know whether a next page exists.
+    """
+    allowed = whitelist(model)
+    keys = allowed.sort_keys(params.sort)
+    sort = ",".join(("-" if descending else "") + column.key for column, descending in keys)
+    fields = allowed.fields(params.fields)
+
+    if fields is None:
+        names = list(allowed.columns)
+    else:
+        names = list(dict.fromkeys(
+            ["id", "version", *fields, *(column.key for column, _ in keys)]
+        ))
+
+    query = (
+        select(*(allowed.columns[name] for name in names))
+        .where(*allowed.where(params.query_params))
+        .order_by(*(column.desc() if descending else column.asc() for column, descending in keys))
+        .limit(params.limit + 1)
+    )
+    if params.cursor is not None:
+        raw = decode_cursor(params.cursor, sort, len(keys))
+        values = [allowed.coerce(column, value) for (column, _), value in zip(keys, raw)]
+        query = query.where(_seek(keys, values))
+
+    result = await db.execute(query)
+    items = result.mappings().all()
+
+    next_cursor = None
+    if len(items) > params.limit:
+        items = items[:params.limit]
+        last = items[-1]
+        next_cursor = encode_cursor(sort, [last[column.key] for column, _ in keys])
+
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def page_response(model, result: dict[str, Any], params: ListParams, response: Response):
+    """Return the page as-is, or just the requested ``fields`` of each row.
+
+    Projected pages can't be validated against the full read model, so they
+    are rendered directly; headers already set on ``response`` are kept.
+    """
+    fields = whitelist(model).fields(params.fields)
+    if fields is None:
+        return result
+
+    returned = ["id", *(name for name in fields if name != "id")]
+    items = [{name: item[name] for name in returned} for item in result["items"]]
+    return ORJSONResponse(
+        {"items": items, "next_cursor": result["next_cursor"]},
+        headers=dict(response.headers)
+    )
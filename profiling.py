@@ -0,0 +1,160 @@
+import hmac
+import logging
+import os
+import random
+import re
+import time
+from contextvars import ContextVar
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger("slow_query")
+
+# Statements at or above this many milliseconds are logged, 0 disables
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 200))
+
+# Fraction of requests profiled without asking, e.g. 0.01 for 1%
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+
+# Sending this header profiles the request, but only when its value is
+# PROFILE_TOKEN: timings and table names are not for anonymous clients.
+# Unset, on-demand profiling is off and only sampling remains
+PROFILE_HEADER = b"x-profile"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "").encode()
+
+# Per-statement Server-Timing entries, the totals always cover everything
+MAX_TIMING_ENTRIES = 20
+
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+\"?(\w+)", re.IGNORECASE)
+
+
+class RequestProfile:
+    """Time spent per DB statement and in password hashing for one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements: List[Tuple[str, float]] = []
+        self.hashing = 0.0
+
+    def server_timing(self) -> str:
+        db_total = sum(seconds for _, seconds in self.statements)
+        entries = [
+            f'db;dur={db_total * 1000:.2f};desc="{len(self.statements)} statements"',
+        ]
+        for position, (label, seconds) in enumerate(self.statements[:MAX_TIMING_ENTRIES]):
+            entries.append(f'sql{position};dur={seconds * 1000:.2f};desc="{label}"')
+        if self.hashing:
+            entries.append(f"hash;dur={self.hashing * 1000:.2f}")
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ", ".join(entries)
+
+
+# The request being served by the current task, if any
+_scope: ContextVar[Optional[dict]] = ContextVar("request_scope", default=None)
+_profile: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def current_route() -> str:
+    scope = _scope.get()
+    if scope is None:
+        return "-"
+    route = scope.get("route")
+    return f"{scope['method']} {route.path if route is not None else scope['path']}"
+
+
+def record_hashing(seconds: float):
+    profile = _profile.get()
+    if profile is not None:
+        profile.hashing += seconds
+
+
+def parameter_shape(parameters: Any) -> Any:
+    """Parameter types without their values, safe to log"""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany: one parameter set per row
+            return f"{len(parameters)} x {parameter_shape(parameters[0])}"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def _label(statement: str) -> str:
+    words = statement.split(None, 1)
+    operation = words[0].upper() if words else "OTHER"
+    table = _TABLE.search(statement)
+    return f"{operation} {table.group(1)}" if table else operation
+
+
+def watch_engine(engine):
+    """Feed statement timings on ``engine`` to the slow-query log and profiles"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profile_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info["profile_start"].pop()
+
+        profile = _profile.get()
+        if profile is not None:
+            profile.statements.append((_label(statement), seconds))
+
+        if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+            logger.warning(
+                "slow query %.1fms route=%s params=%s: %s",
+                seconds * 1000,
+                current_route(),
+                parameter_shape(parameters),
+                " ".join(statement.split()),
+            )
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _failed(context):
+        starts = context.connection.info.get("profile_start") if context.connection else None
+        if starts:
+            starts.pop()
+
+
+class ProfilingMiddleware:
+    """Tracks the current request for the slow-query log and, when asked to,
+    profiles it and returns a ``Server-Timing`` header.
+
+    A request is profiled when it carries ``X-Profile: <PROFILE_TOKEN>`` or
+    is picked by ``PROFILE_SAMPLE_RATE``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        wanted = bool(PROFILE_TOKEN) and any(
+            name == PROFILE_HEADER and hmac.compare_digest(value, PROFILE_TOKEN)
+            for name, value in scope["headers"]
+        )
+        profile = None
+        if wanted or (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+            profile = RequestProfile()
+
+        async def send_wrapper(message):
+            if profile is not None and message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", profile.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        scope_token = _scope.set(scope)
+        profile_token = _profile.set(profile)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _profile.reset(profile_token)
+            _scope.reset(scope_token)
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from typing import Callable, List, Optional
+
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from common import SAFE_METHODS
+
+logger = logging.getLogger("replicas")
+
+# Requests carrying this cookie (or header) read from the primary
+READ_PRIMARY_COOKIE = "read_primary_until"
+READ_PRIMARY_HEADER = "x-read-primary"
+
+# Seconds of replay lag, 0 when caught up or not a standby at all. Comparing
+# LSNs first keeps an idle but fully caught-up standby at 0 lag.
+LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class Replica:
+    def __init__(self, name: str, engine: AsyncEngine):
+        self.name = name
+        self.engine = engine
+        # Unknown until the first health check, reads stay on the primary
+        self.healthy = False
+        self.lag: Optional[float] = None
+
+
+class ReplicaSet:
+    """Chooses the engine for read-only sessions.
+
+    Replicas are health-checked in the background every ``check_interval``
+    seconds; one that can't be reached or whose replay lag exceeds
+    ``max_lag`` seconds is skipped until it recovers. With no healthy
+    replica, reads go to the primary.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: List[Replica],
+        strategy: str = "round_robin",
+        max_lag: float = 1.0,
+        check_interval: float = 5.0,
+        check_timeout: float = 2.0,
+        read_your_writes_window: float = 5.0,
+    ):
+        if strategy not in {"round_robin", "least_connections"}:
+            raise ValueError(f"Unknown replica strategy: {strategy}")
+        self.primary = primary
+        self.replicas = replicas
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.read_your_writes_window = read_your_writes_window
+        self._next = 0
+        self._checked_at = float("-inf")
+        self._check_task: Optional[asyncio.Task] = None
+
+    def choose(self) -> AsyncEngine:
+        if not self.replicas:
+            return self.primary
+        self._schedule_check()
+
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return self.primary
+        if self.strategy == "least_connections":
+            return min(healthy, key=lambda replica: replica.engine.pool.checkedout()).engine
+        self._next = (self._next + 1) % len(healthy)
+        return healthy[self._next].engine
+
+    def _schedule_check(self):
+        now = time.monotonic()
+        if self._check_task is not None or now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        self._check_task = asyncio.get_running_loop().create_task(self.check())
+
+    async def check(self):
+        try:
+            await asyncio.gather(*(self._check_one(replica) for replica in self.replicas))
+        finally:
+            self._check_task = None
+
+    async def _check_one(self, replica: Replica):
+        try:
+            replica.lag = await asyncio.wait_for(self._lag(replica.engine), self.check_timeout)
+        except Exception as exc:
+            if replica.healthy:
+                logger.warning("replica %s unreachable, reading from primary: %s", replica.name, exc)
+            replica.healthy = False
+            replica.lag = None
+            return
+
+        healthy = replica.lag <= self.max_lag
+        if replica.healthy and not healthy:
+            logger.warning("replica %s is %.1fs behind, skipping it", replica.name, replica.lag)
+        replica.healthy = healthy
+
+    async def _lag(self, engine: AsyncEngine) -> float:
+        async with engine.connect() as conn:
+            return float((await conn.execute(LAG_QUERY)).scalar_one())
+
+    def stats(self) -> List[dict]:
+        return [
+            {"name": replica.name, "healthy": replica.healthy, "lag": replica.lag}
+            for replica in self.replicas
+        ]
+
+
+def reads_from_primary(request: Request) -> bool:
+    """True for clients that wrote recently and must see their own writes"""
+    if request.headers.get(READ_PRIMARY_HEADER):
+        return True
+    until = request.cookies.get(READ_PRIMARY_COOKIE)
+    try:
+        return until is not None and float(until) > time.time()
+    except ValueError:
+        return False
+
+
+class ReadYourWritesMiddleware:
+    """After a successful write, pins the client's reads to the primary.
+
+    Sets a ``read_primary_until`` cookie for the replica set's
+    ``read_your_writes_window`` seconds, which should exceed its
+    ``max_lag``. Clients that don't keep cookies can send
+    ``X-Read-Primary: 1`` instead. ``replicas`` is called on each write,
+    so the replica set can be created lazily.
+    """
+
+    def __init__(self, app, replicas: Callable[[], ReplicaSet]):
+        self.app = app
+        self.replicas = replicas
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+        replicas = self.replicas()
+        if not replicas.replicas:
+            await self.app(scope, receive, send)
+            return
+        window = replicas.read_your_writes_window
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + window
+                cookie = (
+                    f"{READ_PRIMARY_COOKIE}={until:.3f}; Max-Age={int(window) + 1}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                headers = list(message.get("headers", []))
+                headers.append((b"set-cookie", cookie.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, constr
-from datetime import date
-from typing import Optional
+from datetime import date, datetime
+from typing import List, Optional
 
 
 # Pydantic model for request validation
@@ -106,4 +106,133 @@ class ComicUpdate(BaseModel):
     user_id: Optional[int] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+# Pydantic models for responses
+class UserRead(BaseModel):
+    id: int
+    name: str
+    username: str
+    email: str
+    role: Optional[str] = None
+    created_at: Optional[datetime] = None
+    version: int
+
+    class Config:
+        from_attributes = True
+
+class BookRead(BaseModel):
+    id: int
+    title: str
+    author: str
+    genre: str
+    published_date: str
+    rating: Optional[int] = None
+    user_id: int
+    created_at: Optional[datetime] = None
+    version: int
+
+    class Config:
+        from_attributes = True
+
+class MovieRead(BaseModel):
+    id: int
+    title: str
+    director: str
+    genre: str
+    release_date: str
+    rating: Optional[int] = None
+    user_id: int
+    created_at: Optional[datetime] = None
+    version: int
+
+    class Config:
+        from_attributes = True
+
+class BoardGameRead(BaseModel):
+    id: int
+    title: str
+    designer: str
+    genre: str
+    release_date: str
+    user_id: int
+    created_at: Optional[datetime] = None
+    version: int
+
+    class Config:
+        from_attributes = True
+
+class ComicRead(BaseModel):
+    id: int
+    title: str
+    author: str
+    genre: str
+    published_date: str
+    user_id: int
+    created_at: Optional[datetime] = None
+    version: int
+
+    class Config:
+        from_attributes = True
+
+class UserCollection(UserRead):
+    books: List[BookRead]
+    movies: List[MovieRead]
+    board_games: List[BoardGameRead]
+    comics: List[ComicRead]
+
+class UserPage(BaseModel):
+    items: List[UserRead]
+    next_cursor: Optional[str] = None
+
+class BookPage(BaseModel):
+    items: List[BookRead]
+    next_cursor: Optional[str] = None
+
+class MoviePage(BaseModel):
+    items: List[MovieRead]
+    next_cursor: Optional[str] = None
+
+class BoardGamePage(BaseModel):
+    items: List[BoardGameRead]
+    next_cursor: Optional[str] = None
+
+class ComicPage(BaseModel):
+    items: List[ComicRead]
+    next_cursor: Optional[str] = None
+
+class BulkItemResult(BaseModel):
+    index: int
+    status: str
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+class Message(BaseModel):
+    message: str
+
+class SearchHit(BaseModel):
+    kind: str
+    id: int
+    title: str
+    creator: str
+    rank: float
+
+class SearchPage(BaseModel):
+    items: List[SearchHit]
+    next_cursor: Optional[str] = None
+
+class GenreStats(BaseModel):
+    genre: str
+    count: int
+    average_rating: Optional[float] = None
+
+class MonthStats(BaseModel):
+    month: date
+    count: int
+    average_rating: Optional[float] = None
+
+class CatalogStats(BaseModel):
+    catalog: str
+    count: int
+    average_rating: Optional[float] = None
@@ -0,0 +1,87 @@
+from typing import Any, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import Float, String, cast, func, literal, literal_column, or_, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models import Book, Movie, BoardGame, Comic
+from pagination import decode_cursor, encode_cursor
+
+# (kind, model, column holding the author/director/designer)
+CATALOGS = [
+    ("book", Book, Book.author),
+    ("movie", Movie, Movie.director),
+    ("board_game", BoardGame, BoardGame.designer),
+    ("comic", Comic, Comic.author),
+]
+
+# Must match the configuration used by the search_vector generated columns
+TS_CONFIG = literal_column("'simple'::regconfig")
+
+
+def _catalog_hits(kind: str, model, creator, q: str):
+    # search_vector is a generated column managed by the migration, not mapped
+    vector = literal_column(f"{model.__tablename__}.search_vector")
+    query = func.websearch_to_tsquery(TS_CONFIG, q)
+    rank = (
+        func.ts_rank(vector, query)
+        + func.greatest(func.similarity(model.title, q), func.similarity(creator, q))
+    )
+    return (
+        select(
+            literal(kind, String).label("kind"),
+            model.id.label("id"),
+            model.title.label("title"),
+            creator.label("creator"),
+            cast(rank, Float).label("rank"),
+        )
+        .where(or_(
+            vector.op("@@")(query),
+            model.title.op("%")(q),
+            creator.op("%")(q),
+        ))
+    )
+
+
+def _cursor_values(cursor: str, sort: str) -> list:
+    rank, kind, row_id = decode_cursor(cursor, sort, 3)
+    if not (isinstance(rank, (int, float)) and isinstance(kind, str) and isinstance(row_id, int)):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return [float(rank), kind, row_id]
+
+
+async def search_catalogs(db: AsyncSession, q: str, limit: int, cursor: Optional[str]) -> dict[str, Any]:
+    """Ranked search over all four catalogs in a single query.
+
+    Each catalog matches on its full-text ``search_vector`` or by trigram
+    similarity on title and creator (typo tolerance), all backed by GIN
+    indexes. Hits are ranked by text rank plus best similarity and paged
+    with a keyset cursor on (rank, kind, id).
+    """
+    hits = union_all(*(_catalog_hits(kind, model, creator, q) for kind, model, creator in CATALOGS)).subquery("hits")
+    order = (hits.c.rank, hits.c.kind, hits.c.id)
+
+    query = (
+        select(hits)
+        .order_by(*(column.desc() for column in order))
+        .limit(limit + 1)
+    )
+    # The cursor is only valid for the query text it was issued for
+    sort = f"search:{q}"
+    if cursor is not None:
+        query = query.where(tuple_(*order) < tuple_(*_cursor_values(cursor, sort)))
+
+    result = await db.execute(query)
+    items = result.mappings().all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(sort, [last["rank"], last["kind"], last["id"]])
+
+    return {"items": items, "next_cursor": next_cursor}
@@ -9,5 +9,6 @@ done
 # Run migrations
 alembic upgrade head
 
-# Start FastAPI
-exec uvicorn main:app --host 0.0.0.0 --port 8000
\ No newline at end of file
+# Start FastAPI: one worker per core by default, see gunicorn.conf.py.
+# exec so SIGTERM reaches gunicorn, which drains the workers gracefully.
+exec gunicorn main:app -c gunicorn.conf.py
\ No newline at end of file
@@ -0,0 +1,224 @@
+"""Catalog statistics and list totals read from the summary tables.
+
+The summaries are kept current by triggers (migration f4c1a8e27b93), so
+every read here touches a handful of rows instead of scanning a catalog.
+reconcile() rebuilds them from the base tables to repair any drift; run it
+from cron with ``python -m stats`` or set STATS_RECONCILE_INTERVAL.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import date
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+from fastapi import Response
+from sqlalchemy import func, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.future import select
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from database import get_engine
+from filters import RESERVED_PARAMS, whitelist
+from models import CatalogGenreStats, CatalogMonthStats, CatalogUserStats, RowCount
+
+logger = logging.getLogger(__name__)
+
+# Seconds between reconcile runs, 0 to leave it to an external scheduler
+RECONCILE_INTERVAL = float(os.getenv("STATS_RECONCILE_INTERVAL", 0))
+
+# Advisory lock held while reconciling, so only one process does the work
+RECONCILE_LOCK = 0x5747
+
+TOTAL_HEADER = "X-Total-Count"
+ESTIMATED_HEADER = "X-Total-Count-Estimated"
+
+
+class Catalog(str, Enum):
+    books = "books"
+    movies = "movies"
+    board_games = "board_games"
+    comics = "comics"
+
+
+# Filters a summary table answers exactly: name -> (summary, its key column)
+EXACT_FILTERS = {
+    "genre": (CatalogGenreStats, CatalogGenreStats.genre),
+    "user_id": (CatalogUserStats, CatalogUserStats.user_id),
+}
+
+
+def _summed(stats, key) -> Any:
+    # Shards and keys whose items were all deleted are folded away here
+    return (
+        select(
+            key.label("key"),
+            func.sum(stats.item_count).label("count"),
+            func.sum(stats.rating_sum).label("rating_sum"),
+            func.sum(stats.rating_count).label("rating_count"),
+        )
+        .group_by(key)
+        .having(func.sum(stats.item_count) > 0)
+        .order_by(key)
+    )
+
+
+def _rows(result, key_name: str) -> List[Dict[str, Any]]:
+    return [
+        {
+            key_name: row.key,
+            "count": int(row.count),
+            "average_rating": row.rating_sum / row.rating_count if row.rating_count else None,
+        }
+        for row in result
+    ]
+
+
+async def genre_stats(db: AsyncSession, catalog: Catalog) -> List[Dict[str, Any]]:
+    query = _summed(CatalogGenreStats, CatalogGenreStats.genre).where(
+        CatalogGenreStats.catalog == catalog.value)
+    return _rows(await db.execute(query), "genre")
+
+
+async def month_stats(
+    db: AsyncSession, catalog: Catalog, since: Optional[date], until: Optional[date]
+) -> List[Dict[str, Any]]:
+    query = _summed(CatalogMonthStats, CatalogMonthStats.month).where(
+        CatalogMonthStats.catalog == catalog.value)
+    if since is not None:
+        query = query.where(CatalogMonthStats.month >= since.replace(day=1))
+    if until is not None:
+        query = query.where(CatalogMonthStats.month <= until)
+    return _rows(await db.execute(query), "month")
+
+
+async def user_stats(db: AsyncSession, user_id: int) -> List[Dict[str, Any]]:
+    query = _summed(CatalogUserStats, CatalogUserStats.catalog).where(
+        CatalogUserStats.user_id == user_id)
+    return _rows(await db.execute(query), "catalog")
+
+
+async def row_totals(db: AsyncSession) -> Dict[str, int]:
+    result = await db.execute(
+        select(RowCount.table_name, func.sum(RowCount.row_count))
+        .group_by(RowCount.table_name)
+        .order_by(RowCount.table_name)
+    )
+    return {table_name: int(total) for table_name, total in result}
+
+
+class _Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) of a statement, keeping its bound parameters."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+async def _estimate(db: AsyncSession, model, query_params) -> Tuple[int, bool]:
+    query = select(model.id).where(*whitelist(model).where(query_params))
+    dialect = db.get_bind().dialect
+    if dialect.name != "postgresql":
+        return await db.scalar(select(func.count()).select_from(query.subquery())), True
+
+    # The planner's row estimate: costs planning only, however many rows match.
+    # Filter values stay bound parameters, never part of the SQL text
+    plan = (await db.execute(_Explain(query))).scalar_one()
+    if isinstance(plan, str):
+        plan = orjson.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"]), False
+
+
+async def list_total(db: AsyncSession, model, query_params) -> Tuple[int, bool]:
+    """(total, exact) for a list route's filters, without COUNT(*).
+
+    Unfiltered lists and a single ``genre`` or ``user_id`` filter on a
+    catalog are answered exactly from the summary tables, anything else
+    with the planner's estimate.
+    """
+    table = model.__tablename__
+    filters = [name for name in query_params.keys() if name not in RESERVED_PARAMS]
+    if not filters:
+        total = await db.scalar(
+            select(func.coalesce(func.sum(RowCount.row_count), 0)).where(RowCount.table_name == table))
+        return int(total), True
+
+    values = query_params.getlist(filters[0])
+    if len(filters) == 1 and len(values) == 1 and filters[0] in EXACT_FILTERS and table in Catalog.__members__:
+        stats, key = EXACT_FILTERS[filters[0]]
+        allowed = whitelist(model)
+        value = allowed.coerce(allowed.columns[filters[0]], values[0])
+        total = await db.scalar(
+            select(func.coalesce(func.sum(stats.item_count), 0))
+            .where(stats.catalog == table, key == value)
+        )
+        return int(total), True
+
+    return await _estimate(db, model, query_params)
+
+
+async def set_total_headers(db: AsyncSession, model, query_params, response: Response):
+    total, exact = await list_total(db, model, query_params)
+    response.headers[TOTAL_HEADER] = str(total)
+    if not exact:
+        response.headers[ESTIMATED_HEADER] = "true"
+
+
+async def reconcile(engine: AsyncEngine) -> bool:
+    """Rebuild the summaries from the base tables, False if another process is at it.
+
+    Writes to the catalogs wait until it finishes, reads don't.
+    """
+    async with engine.begin() as conn:
+        locked = await conn.scalar(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": RECONCILE_LOCK})
+        if not locked:
+            return False
+        # Scans every catalog; not subject to the request statement_timeout
+        await conn.execute(text("SET LOCAL statement_timeout = 0"))
+        await conn.execute(text("SELECT reconcile_summaries()"))
+    return True
+
+
+async def reconcile_periodically(engine: AsyncEngine, interval: float):
+    """Reconcile every ``interval`` seconds, for as long as the task runs.
+
+    Runs are aligned to the wall clock, so when every worker runs this loop
+    they wake together and all but the advisory lock holder skip the run.
+    """
+    while True:
+        await asyncio.sleep(interval - time.time() % interval)
+        started = time.perf_counter()
+        try:
+            if await reconcile(engine):
+                logger.info("Reconciled summary tables in %.2f s", time.perf_counter() - started)
+        except Exception:
+            logger.exception("Reconciling summary tables failed")
+
+
+async def _main():
+    engine = get_engine()
+    try:
+        started = time.perf_counter()
+        if await reconcile(engine):
+            print(f"Reconciled summary tables in {time.perf_counter() - started:.2f} s")
+        else:
+            print("Another process is reconciling the summary tables, skipped")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    # Run from cron there is no server to load .env for us
+    load_dotenv()
+    asyncio.run(_main())
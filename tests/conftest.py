@@ -0,0 +1,66 @@
+"""Fixtures for tests that need a database.
+
+Set TEST_DATABASE_URL to a scratch PostgreSQL database; its tables are
+dropped and recreated for every test. Without it the database tests are
+skipped.
+"""
+import os
+
+import httpx
+import pytest
+import pytest_asyncio
+from sqlalchemy import event
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    # Read by database.get_settings() on first use, so set before any engine exists
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+from database import AsyncSessionLocal, Base, get_engine  # noqa: E402
+
+
+@pytest_asyncio.fixture
+async def engine():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    engine = get_engine()
+    async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        yield engine
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+        # Pooled connections belong to this test's event loop
+        await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def db(engine):
+    async with AsyncSessionLocal(bind=engine) as session:
+        yield session
+
+
+@pytest_asyncio.fixture
+async def client(engine):
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+def statements(engine):
+    """SQL statements sent on ``engine`` while the test runs"""
+    sent = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        sent.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    yield sent
+    event.remove(engine.sync_engine, "before_cursor_execute", record)
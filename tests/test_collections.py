@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.future import select
+
+from models import BoardGame, Book, Comic, Movie, User
+
+# One query for the users plus one selectinload per relationship
+COLLECTION_QUERIES = 5
+
+
+async def add_user(db, name: str, items: int) -> int:
+    user = User(name=name, username=name, email=f"{name}@example.com", password="x", role="user")
+    for n in range(items):
+        user.books.append(Book(title=f"{name} book {n}", author="A", genre="Fiction", published_date="2020-01-01"))
+        user.movies.append(Movie(title=f"{name} movie {n}", director="D", genre="Drama", release_date="2020-01-01"))
+        user.board_games.append(BoardGame(title=f"{name} game {n}", designer="G", genre="Euro", release_date="2020-01-01"))
+        user.comics.append(Comic(title=f"{name} comic {n}", author="A", genre="Hero", published_date="2020-01-01"))
+    db.add(user)
+    await db.commit()
+    return user.id
+
+
+def selects(statements):
+    return [statement for statement in statements if statement.lstrip().upper().startswith("SELECT")]
+
+
+@pytest.mark.asyncio
+async def test_user_collection_query_count_is_fixed(db, client, statements):
+    few = await add_user(db, "few", items=1)
+    many = await add_user(db, "many", items=25)
+
+    counts = {}
+    for user_id, items in ((few, 1), (many, 25)):
+        statements.clear()
+        response = await client.get(f"/users/{user_id}/collection")
+        assert response.status_code == 200
+        assert len(response.json()["books"]) == items
+        counts[items] = len(selects(statements))
+
+    assert counts == {1: COLLECTION_QUERIES, 25: COLLECTION_QUERIES}
+
+
+@pytest.mark.asyncio
+async def test_user_collections_query_count_is_fixed(db, client, statements):
+    ids = [await add_user(db, f"user{n}", items=n) for n in range(1, 6)]
+
+    statements.clear()
+    response = await client.get("/users/collections", params={"ids": ids[:1]})
+    assert response.status_code == 200
+    one = len(selects(statements))
+
+    statements.clear()
+    response = await client.get("/users/collections", params={"ids": ids})
+    assert response.status_code == 200
+    assert [user["id"] for user in response.json()] == ids
+    assert [len(user["comics"]) for user in response.json()] == [1, 2, 3, 4, 5]
+
+    assert one == len(selects(statements)) == COLLECTION_QUERIES
+
+
+@pytest.mark.asyncio
+async def test_relationships_are_never_lazy_loaded(db):
+    user_id = await add_user(db, "lazy", items=2)
+    db.expunge_all()
+
+    user = (await db.execute(select(User).where(User.id == user_id))).scalar_one()
+    for relationship in ("books", "movies", "board_games", "comics"):
+        with pytest.raises(InvalidRequestError, match="lazy='raise'"):
+            getattr(user, relationship)
+
+    book = (await db.execute(select(Book).where(Book.user_id == user_id).limit(1))).scalar_one()
+    with pytest.raises(InvalidRequestError, match="lazy='raise'"):
+        book.user
@@ -0,0 +1,22 @@
+from etag import collection_etag
+
+PAGE = {"items": [{"id": 1, "version": 2}, {"id": 5, "version": 1}], "next_cursor": "abc"}
+
+
+def test_projections_of_one_page_get_different_etags():
+    tags = {
+        collection_etag(PAGE),
+        collection_etag(PAGE, "title"),
+        collection_etag(PAGE, "author"),
+        collection_etag(PAGE, "title,author"),
+    }
+    assert len(tags) == 4
+
+
+def test_equivalent_projections_share_an_etag():
+    assert collection_etag(PAGE, "title,author") == collection_etag(PAGE, " author, title,id")
+
+
+def test_new_version_changes_etag():
+    changed = {"items": [{"id": 1, "version": 3}, {"id": 5, "version": 1}], "next_cursor": "abc"}
+    assert collection_etag(PAGE, "title") != collection_etag(changed, "title")
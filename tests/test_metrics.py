@@ -0,0 +1,45 @@
+import httpx
+import pytest
+
+from admission import admission
+from main import app
+from metrics import REQUEST_LATENCY
+
+
+def routes_recorded():
+    return {
+        (sample.labels["route"], sample.labels["status"])
+        for metric in REQUEST_LATENCY.collect()
+        for sample in metric.samples
+        if sample.name.endswith("_count")
+    }
+
+
+@pytest.mark.asyncio
+async def test_shed_requests_are_not_labelled_by_raw_path(monkeypatch):
+    # A full read queue sheds every read before routing runs
+    read = admission.classes["read"]
+    monkeypatch.setattr(read, "limit", 0)
+    monkeypatch.setattr(read, "max_queue", 0)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        for book_id in range(1000, 1005):
+            response = await client.get(f"/books/{book_id}")
+            assert response.status_code == 503
+
+    recorded = routes_recorded()
+    assert ("unmatched", "503") in recorded
+    assert not [route for route, _ in recorded if route.startswith("/books/1")]
+
+
+@pytest.mark.asyncio
+async def test_matched_routes_are_labelled_by_template():
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        assert (await client.get("/openapi.json")).status_code == 200
+        assert (await client.get("/no/such/path")).status_code == 404
+
+    recorded = routes_recorded()
+    assert ("/openapi.json", "200") in recorded
+    assert ("unmatched", "404") in recorded
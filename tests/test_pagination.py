@@ -0,0 +1,63 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy.future import select
+
+from filters import whitelist
+from models import Book, User
+from pagination import _seek
+
+RATINGS = [3, None, 1, 3, None, 2, 1, None, 3]
+
+
+@pytest_asyncio.fixture
+async def books(db):
+    if db.get_bind().dialect.name != "postgresql":
+        pytest.skip("keyset seeks rely on PostgreSQL NULL ordering")
+    user = User(name="reader", username="reader", email="reader@example.com", password="x", role="user")
+    for n, rating in enumerate(RATINGS):
+        # Authors repeat so multi-key sorts tie on them too
+        user.books.append(Book(title=f"Book {n}", author=f"Author {n % 3}", genre="Fiction",
+                               published_date="2020-01-01", rating=rating))
+    db.add(user)
+    await db.commit()
+
+
+async def walk(db, keys):
+    """Every book, one seek at a time from the previous row's key values"""
+    columns = [column for column, _ in keys]
+    order = [column.desc() if descending else column.asc() for column, descending in keys]
+    query = select(*columns).order_by(*order).limit(1)
+    rows = []
+    row = (await db.execute(query)).first()
+    while row is not None:
+        rows.append(tuple(row))
+        row = (await db.execute(query.where(_seek(keys, list(row))))).first()
+    return rows
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sort", [
+    "id", "-id", "rating", "-rating", "rating,-author", "-rating,author", "author,-rating",
+])
+async def test_seek_visits_rows_in_order_by_order(db, books, sort):
+    keys = whitelist(Book).sort_keys(sort)
+    columns = [column for column, _ in keys]
+    order = [column.desc() if descending else column.asc() for column, descending in keys]
+    expected = [tuple(row) for row in await db.execute(select(*columns).order_by(*order))]
+
+    assert await walk(db, keys) == expected
+    assert len(expected) == len(RATINGS)
+
+
+@pytest.mark.asyncio
+async def test_seek_past_null_cursor(db, books):
+    # Ascending NULLs sort last: after the last NULL only ties on id remain
+    keys = whitelist(Book).sort_keys("rating")
+    ids = (await db.scalars(select(Book.id).where(Book.rating.is_(None)).order_by(Book.id))).all()
+    after = await db.scalars(select(Book.id).where(_seek(keys, [None, ids[0]])).order_by(Book.id))
+    assert after.all() == ids[1:]
+
+    # Descending NULLs sort first: everything rated follows them
+    keys = whitelist(Book).sort_keys("-rating")
+    after = await db.scalars(select(Book.id).where(_seek(keys, [None, ids[-1]])))
+    assert len(after.all()) == len(RATINGS) - len(ids)